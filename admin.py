@@ -0,0 +1,60 @@
+import streamlit as st
+import os
+from dotenv import load_dotenv
+from metrics import registry
+from llm_cache import llm_cache
+import youtube_quota
+import auto_email
+
+# Load environment variables
+load_dotenv()
+admin_usernames = {name.strip() for name in os.getenv("admin_usernames", "").split(",") if name.strip()}
+
+def is_admin(username):
+    return bool(username) and username in admin_usernames
+
+def admin_panel():
+
+    if st.button("Back to Home", key="admin_back"): # Back button
+        st.session_state["page"] = "home"
+        st.rerun()
+
+    #session check
+    username = st.session_state.get("username")
+    if not is_admin(username):
+        st.error("You must be an admin to view this page.")
+        return
+
+    st.title("Performance")
+    st.caption("Timings from this app process since it started. The scheduler reports its own through its metrics file or endpoint.")
+
+    # Stage timings
+    stages = registry.stage_summary()
+    if stages:
+        st.subheader("Stages")
+        st.dataframe([
+            {"Stage": row["stage"], "Platform": row["platform"] or "-", "Count": row["count"], "Errors": row["errors"],
+             "p50 (ms)": round(row["p50_ms"], 1), "p95 (ms)": round(row["p95_ms"], 1), "Max (ms)": round(row["max_ms"], 1)}
+            for row in stages
+        ], use_container_width=True)
+    else:
+        st.info("No timings recorded yet. Summarize or verify a competitor to collect some.")
+
+    # Counters
+    counters = registry.counter_summary()
+    if counters:
+        st.subheader("Counters")
+        st.dataframe(counters, use_container_width=True)
+
+    cache_stats = llm_cache.stats()
+    st.subheader("LLM cache")
+    st.markdown(f"**Hit rate:** {cache_stats['hit_rate']:.0%} ({cache_stats['memory_hits']} memory, {cache_stats['disk_hits']} disk, {cache_stats['misses']} misses)")
+
+    st.subheader("YouTube quota")
+    st.markdown(f"**Used today:** {youtube_quota.used()} of {youtube_quota.youtube_daily_quota} units")
+
+    st.subheader("Scheduled briefs")
+    stuck = auto_email.count_stuck_users()
+    st.markdown(f"**Paused after {auto_email.max_attempts} failed attempts:** {stuck} users (retried after {auto_email.attempts_cooldown // 3600} hours)")
+
+    st.download_button("Download Prometheus metrics", registry.render_prometheus(), file_name="metrics.prom", mime="text/plain")
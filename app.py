@@ -1,137 +1,253 @@
 import streamlit as st
 import os
+import io
+import re
+import csv
+import time
+import queue
+import threading
 import json
-import smtplib
 import sqlite3
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 from dateutil import tz
-from email.mime.text import MIMEText
-from googleapiclient.discovery import build
 from googleapiclient.errors import HttpError
-from instagram_graph_api import get_post_uploaded_instagram, gemini_model_insta
-from youtube_data_api import get_video_uploaded_youtube, gemini_model_youtube
+from instagram_graph_api import gemini_request_insta
+from youtube_data_api import gemini_request_youtube, get_youtube
+from gemini_service import gemini_service
+from llm_cache import CachedResponse
+from fetcher import fetch_competitor_content
+from youtube_cache import store_channel
+from verification_cache import get_verification, store_verification
+from youtube_quota import QuotaExceeded, quota_context
+from content_store import load_posts, load_videos
+from prompt_compaction import compact_posts, compact_videos
+from graph_client import graph
+from token_manager import token_manager
+from mailer import enqueue_mail, send_now
 from dotenv import load_dotenv
 import requests
+import db
+import metrics
 
 # Load environment variables
 load_dotenv()
-youtube_api_key = os.getenv("youtube_data_api")
 ig_user_id = os.getenv("ig_user_id")
-long_access_token = os.getenv("long_access_token")
-app_id = os.getenv("app_id")
-app_secret = os.getenv("app_secret")
-user_access_token = os.getenv("user_access_token")
-sender_email_id = os.getenv("sender_email_id")
-sender_email_id_password = os.getenv("sender_email_id_password")
-
-# YouTube API setup
-try:
-    youtube = build("youtube", "v3", developerKey=youtube_api_key)
-except Exception as e:
-    st.error(f"Error initializing YouTube API: {str(e)}")
-    youtube = None
-
-# Database setup
-def init_db():
-    with sqlite3.connect("competitors.db", check_same_thread=False) as conn:
-        cursor = conn.cursor()
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS competitors (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                user_id TEXT NOT NULL,
-                username TEXT,
-                youtube TEXT,
-                instagram TEXT,
-                verified BOOLEAN DEFAULT FALSE,
-                FOREIGN KEY (user_id) REFERENCES users(username)
-            )
-        """)
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS users (
-                username TEXT PRIMARY KEY,
-                email TEXT NOT NULL
-            )
-        """)
-        conn.commit()
-
-# Initialize database
-init_db()
+verify_max_workers = int(os.getenv("verify_max_workers", "8"))
+brief_mode = os.getenv("brief_mode", "llm")  # "llm" for Gemini briefs, "fast" for the local trend analysis
+brief_llm_timeout = float(os.getenv("brief_llm_timeout", "90"))  # seconds before a platform falls back to the local analysis
 
-def valid_user_yt(handle):
-    if not youtube:
-        return False
+def check_youtube_handle(handle):
+    """
+    Check that a YouTube handle exists. Returns (valid, error), where error is a
+    message for checks that failed rather than answered; those are not cached.
+    """
+    cached = get_verification("youtube", handle)
+    if cached is not None:
+        return cached, None
     try:
-        request = youtube.channels().list(
-            part="id",
-            forHandle=handle
-        )
-        response = request.execute()
-        return bool(response.get("items"))
+        youtube = get_youtube()
+    except Exception as e:
+        return False, f"Error initializing YouTube API: {str(e)}"
+    try:
+        with quota_context(handle=handle):
+            request = youtube.channels().list(
+                part="id,contentDetails",
+                forHandle=handle
+            )
+            response = request.execute()
+        if not response.get("items"):
+            return store_verification("youtube", handle, False), None
+        store_channel(handle, response["items"][0])  # Warm the uploads playlist cache
+        return store_verification("youtube", handle, True), None
+    except QuotaExceeded as e:
+        return False, str(e)
     except HttpError as e:
-        st.error(f"YouTube API error: {str(e)}")
-        return False
+        return False, f"YouTube API error: {str(e)}"
     except Exception:
-        return False
+        return False, None
 
-def valid_user_insta(ig_username):
-    if not ig_user_id or not long_access_token:
-        return False
-    required_parameter = "{media{caption,timestamp,like_count}}"
-    url = f"https://graph.facebook.com/v17.0/{ig_user_id}?fields=business_discovery.username({ig_username}){required_parameter}&access_token={long_access_token}"
-    
+def valid_user_yt(handle):
+    with quota_context(user=st.session_state.get("username")):
+        valid, error = check_youtube_handle(handle)
+    if error:
+        st.error(error)
+    return valid
+
+INSTAGRAM_NOT_FOUND_CODES = {100, 110}  # Graph API error codes for an unknown or malformed username
+
+def check_instagram_handle(ig_username):
+    """
+    Check that an Instagram business or creator account exists. Returns (valid, error) like check_youtube_handle.
+    """
+    cached = get_verification("instagram", ig_username)
+    if cached is not None:
+        return cached, None
+    access_token = token_manager.current()
+    if not ig_user_id or not access_token:
+        return False, "Instagram API is not configured: missing ig_user_id or access token"
     try:
-        response = requests.get(url)
-        response.raise_for_status()
-        metadata = response.json()
-        return "business_discovery" in metadata and not metadata.get("error")
-    except Exception:
-        return False
+        # Only the account id; the media listing is not needed to know the account exists
+        metadata = graph.get(ig_user_id, params={
+            "fields": f"business_discovery.username({ig_username}){{id}}",
+            "access_token": access_token
+        })
+        return store_verification("instagram", ig_username, "business_discovery" in metadata and not metadata.get("error")), None
+    except requests.exceptions.HTTPError as e:
+        try:
+            code = e.response.json().get("error", {}).get("code")
+        except ValueError:
+            code = None
+        if code in INSTAGRAM_NOT_FOUND_CODES:
+            return store_verification("instagram", ig_username, False), None
+        return False, f"Instagram API error: {str(e)}"
+    except Exception as e:
+        return False, f"Error checking Instagram handle: {str(e)}"
+
+def valid_user_insta(ig_username):
+    valid, error = check_instagram_handle(ig_username)
+    if error:
+        st.error(error)
+    return valid
+
+def verify_rows(rows, max_workers=verify_max_workers):
+    """
+    Verify the handles of many competitor rows at once. Each distinct handle is
+    checked once, all of them concurrently. Invalid handles are cleared, handles
+    whose check failed are kept for a later retry, and rows with at least one
+    valid handle are marked verified, in place.
+    Returns a list of messages describing the invalid handles and failed checks.
+    """
+    checks = {}
+    for item in rows:
+        if item.get('youtube'):
+            checks.setdefault(("youtube", item['youtube']), None)
+        if item.get('instagram'):
+            checks.setdefault(("instagram", item['instagram']), None)
+    check = {"youtube": check_youtube_handle, "instagram": check_instagram_handle}
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        # Each check runs in a copy of the caller's context so quota is attributed to the same user
+        futures = {key: executor.submit(contextvars.copy_context().run, check[key[0]], key[1]) for key in checks}
+        checks = {key: future.result() for key, future in futures.items()}
+
+    problems = []
+    for index, item in enumerate(rows):
+        verified = False
+        for platform, label in (("youtube", "YouTube"), ("instagram", "Instagram")):
+            handle = item.get(platform)
+            if not handle:
+                item[platform] = ''
+                continue
+            valid, error = checks[(platform, handle)]
+            if error:
+                problems.append(f"Row {index + 1}: Could not check {label} handle '{handle}': {error}")
+            elif not valid:
+                problems.append(f"Row {index + 1}: Invalid {label} handle '{handle}'.")
+                item[platform] = ''
+            verified = verified or valid
+        item['verified'] = verified
+    return problems
+
+# Header cells accepted in a bulk import, including the labels of the competitor form
+CSV_COLUMNS = {
+    "username": "username", "name": "username",
+    "youtube": "youtube", "youtube handle": "youtube",
+    "instagram": "instagram",
+}
+
+def parse_competitor_rows(text):
+    """
+    Parse CSV or pasted rows of username, YouTube handle, Instagram username.
+    A header row naming those columns is optional; blank lines are skipped.
+    """
+    lines = [line for line in csv.reader(io.StringIO(text)) if any(cell.strip() for cell in line)]
+    if not lines:
+        return []
+    columns = ['username', 'youtube', 'instagram']
+    header = [cell.strip().lower() for cell in lines[0]]
+    # Only a row made of known column names is a header, so a competitor called "Namecheap" is still imported
+    if all(cell in CSV_COLUMNS for cell in header if cell):
+        columns, lines = [CSV_COLUMNS.get(cell, cell) for cell in header], lines[1:]
+    rows = []
+    for line in lines:
+        values = dict(zip(columns, (cell.strip() for cell in line)))
+        rows.append({'username': values.get('username', ''), 'youtube': values.get('youtube', ''),
+                     'instagram': values.get('instagram', ''), 'verified': False})
+    return rows
 
 def valid_email(email):
     try:
-        s = smtplib.SMTP('smtp.gmail.com', 587)
-        s.starttls()
-        s.login(sender_email_id, sender_email_id_password)
-        s.sendmail(sender_email_id, email, "email verified")
-        s.quit()
+        send_now(email, "Email verification", "email verified")
         return True
     except:
         return False
 
 # Load and save data functions
+_saved_rows = {}  # user_id -> rows as last read from or written to the database
+
+def _row_state(item):
+    return (item.get('username') or '', item.get('youtube') or '', item.get('instagram') or '', bool(item.get('verified')))
+
 def load_data(user_id):
     try:
-        with sqlite3.connect("competitors.db", check_same_thread=False) as conn:
-            cursor = conn.cursor()
-            cursor.execute("""
-                SELECT username, youtube, instagram, verified 
-                FROM competitors 
-                WHERE user_id = ?
-            """, (user_id,))
-            rows = cursor.fetchall()
-            return [{"username": row[0], "youtube": row[1], "instagram": row[2], "verified": row[3]} for row in rows]
+        rows = db.query(db.COMPETITORS, """
+            SELECT id, username, youtube, instagram, verified 
+            FROM competitors 
+            WHERE user_id = ?
+            ORDER BY id
+        """, (user_id,))
+        data = [{"id": row[0], "username": row[1], "youtube": row[2], "instagram": row[3], "verified": row[4]} for row in rows]
+        _saved_rows[user_id] = {item["id"]: _row_state(item) for item in data}
+        return data
     except sqlite3.Error as e:
         st.error(f"Database error: {e}")
         return [{} for _ in range(4)]
 
 def save_data(user_id, data):
+    """
+    Persist a user's competitor rows. Rows keep their database id, so only rows
+    that changed are written, new rows are inserted and get their id assigned in
+    place, and an unchanged list writes nothing.
+    """
+    saved = _saved_rows.get(user_id)
+    current = {item["id"]: _row_state(item) for item in data if item.get("id") is not None}
+    if saved is not None and current == saved and len(current) == len(data):
+        return  # Nothing changed since the last load or save
     try:
-        with sqlite3.connect("competitors.db", check_same_thread=False) as conn:
+        with db.transaction(db.COMPETITORS, immediate=True) as conn:
             cursor = conn.cursor()
-            cursor.execute("DELETE FROM competitors WHERE user_id = ?", (user_id,))
+            if saved is None:
+                cursor.execute("SELECT id, username, youtube, instagram, verified FROM competitors WHERE user_id = ?", (user_id,))
+                saved = {row[0]: _row_state(dict(zip(("username", "youtube", "instagram", "verified"), row[1:]))) for row in cursor.fetchall()}
+
+            removed = [(row_id, user_id) for row_id in saved if row_id not in current]
+            if removed:
+                cursor.executemany("DELETE FROM competitors WHERE id = ? AND user_id = ?", removed)
+
+            changed = [(row_id, user_id, *state) for row_id, state in current.items() if saved.get(row_id) != state]
+            if changed:
+                cursor.executemany("""
+                    INSERT INTO competitors (id, user_id, username, youtube, instagram, verified)
+                    VALUES (?, ?, ?, ?, ?, ?)
+                    ON CONFLICT(id) DO UPDATE SET
+                        username = excluded.username,
+                        youtube = excluded.youtube,
+                        instagram = excluded.instagram,
+                        verified = excluded.verified
+                    WHERE competitors.user_id = excluded.user_id
+                """, changed)
+
             for item in data:
-                cursor.execute("""
-                    INSERT INTO competitors (user_id, username, youtube, instagram, verified)
-                    VALUES (?, ?, ?, ?, ?)
-                """, (
-                    user_id,
-                    item.get('username', ''),
-                    item.get('youtube', ''),
-                    item.get('instagram', ''),
-                    item.get('verified', False)
-                ))
-            conn.commit()
+                if item.get("id") is None:
+                    cursor.execute("""
+                        INSERT INTO competitors (user_id, username, youtube, instagram, verified)
+                        VALUES (?, ?, ?, ?, ?)
+                    """, (user_id, *_row_state(item)))
+                    item["id"] = cursor.lastrowid
+        _saved_rows[user_id] = {item["id"]: _row_state(item) for item in data}
     except sqlite3.Error as e:
+        _saved_rows.pop(user_id, None)  # Re-read the database on the next save
         st.error(f"Database error: {e}")
 
 # Initialize session state
@@ -139,8 +255,32 @@ if 'competitors' not in st.session_state:
     username = st.session_state.get("username", "default_user")  # Assume username is set during login
     st.session_state.competitors = load_data(username) or [{} for _ in range(4)]
 
-def summarize_competitors(username):
-    
+def format_video(video, score=None):
+    stats = f"Views: {video.view_count if video.view_count is not None else 'N/A'}, Likes: {video.like_count if video.like_count is not None else 'N/A'}, Comments: {video.comment_count if video.comment_count is not None else 'N/A'}"
+    if score:
+        stats += f"\n{score.describe()}"
+    return f"Title: {video.title}\n{stats}\nDescription: {video.description}"
+
+def parse_brief(response, platform, trend_key, recommend_key):
+    """
+    Read the trend and recommendation fields from a Gemini JSON response.
+    """
+    try:
+        if response:
+            response_json = json.loads(response.text)
+            return (response_json.get(trend_key, "No trends available"),
+                    response_json.get(recommend_key, "No recommendations available"))
+        st.error(f"No response from Gemini for {platform} data")
+    except json.JSONDecodeError as e:
+        st.error(f"Error parsing {platform} Gemini response: {str(e)}")
+    except Exception as e:
+        st.error(f"Error processing {platform} summary: {str(e)}")
+    return "", ""
+
+def get_verified_handles(username):
+    """
+    Return (instagram_usernames, youtube_handles) for a user's verified competitors.
+    """
     verified_youtube_handle = []
     verified_instagram_username = []
     data = load_data(username)
@@ -149,59 +289,60 @@ def summarize_competitors(username):
             verified_youtube_handle.append(item["youtube"])
         if item.get("verified") and item.get("instagram"):
             verified_instagram_username.append(item["instagram"])
+    return verified_instagram_username, verified_youtube_handle
 
-    # Process Instagram data
-    summerized_insta_captionn_likes = []
-    for ig_username in verified_instagram_username:
-        if ig_username:
-            try:
-                posts = get_post_uploaded_instagram(ig_username)
-                summerized_insta_captionn_likes.extend(posts)
-            except Exception as e:
-                st.error(f"Error fetching Instagram data for {ig_username}: {str(e)}")
+def summarize_competitors(username, mode=None):
+    verified_instagram_username, verified_youtube_handle = get_verified_handles(username)
 
-    instagram_trend, instagram_recommend = "", ""
-    if summerized_insta_captionn_likes:
-        try:
-            response = gemini_model_insta(summerized_insta_captionn_likes)
-            if response:
-                response_json = json.loads(response.text)
-                instagram_trend = response_json.get("instagram_trend", "No trends available")
-                instagram_recommend = response_json.get("instagram_recommend", "No recommendations available")
-            else:
-                st.error("No response from Gemini for Instagram data")
-        except json.JSONDecodeError as e:
-            st.error(f"Error parsing Instagram Gemini response: {str(e)}")
-        except Exception as e:
-            st.error(f"Error processing Instagram summary: {str(e)}")
+    # Fetch all competitors concurrently
+    with quota_context(user=username), metrics.span("brief.fetch"):
+        instagram_results, youtube_results = fetch_competitor_content(verified_instagram_username, verified_youtube_handle)
+    for result in instagram_results:
+        if result.error:
+            st.error(f"Error fetching Instagram data for {result.handle}: {str(result.error)}")
+    for result in youtube_results:
+        if result.error:
+            st.error(f"Error fetching YouTube data for {result.handle}: {str(result.error)}")
+
+    with metrics.tagged(user=username):
+        return build_summary(username, verified_instagram_username, verified_youtube_handle, mode)
+
+def prepare_brief_requests(username, verified_instagram_username, verified_youtube_handle):
+    """
+    Rank the stored content in the summary window by engagement, keep the
+    top items per platform and compact them into the two Gemini requests for
+    a brief. A platform with no content gets None.
+    """
+    from engagement import select_posts, select_videos  # Deferred, numpy alone costs ~100ms on every page import
+
+    posts = load_posts(verified_instagram_username)  # Summary window from the local store
+    videos = load_videos(verified_youtube_handle)
+    with metrics.span("brief.rank") as fields:
+        top_posts = select_posts(posts)
+        top_videos, video_scores = select_videos(videos)
+        fields["posts"], fields["videos"] = len(top_posts), len(video_scores)
+    metrics.event("Engagement ranking", user=username, posts=len(top_posts), posts_total=len(posts),
+                  videos=len(video_scores), videos_total=sum(len(v) for v in videos.values()))
+
+    with metrics.span("brief.compact") as fields:
+        # Process Instagram data
+        summerized_insta_captionn_likes, instagram_stats = compact_posts(top_posts)
+        instagram_request = gemini_request_insta(summerized_insta_captionn_likes) if summerized_insta_captionn_likes else None
 
-    # Process YouTube data
+        # Process YouTube data
+        videos_by_handle, youtube_stats = compact_videos(top_videos)
+        fields["tokens_saved"] = instagram_stats.tokens_saved + youtube_stats.tokens_saved
+    metrics.event("Prompt compaction", user=username, instagram_tokens_saved=instagram_stats.tokens_saved,
+                  youtube_tokens_saved=youtube_stats.tokens_saved)
     summerized_youtube_title_description = []
-    for handle in verified_youtube_handle:
-        if handle:
-            try:
-                get_yt_details = get_video_uploaded_youtube(handle)
-                video_content = "\n".join([f"Title: {title}\nDescription: {description}" for title, description in get_yt_details.items()])
-                summerized_youtube_title_description.append(video_content)
-            except Exception as e:
-                st.error(f"Error fetching YouTube data for {handle}: {str(e)}")
+    for videos in videos_by_handle.values():
+        video_content = "\n".join([format_video(video, video_scores.get(video.video_id)) for video in videos])
+        summerized_youtube_title_description.append(video_content)
+    youtube_request = gemini_request_youtube(summerized_youtube_title_description) if summerized_youtube_title_description else None
+    return instagram_request, youtube_request
 
-    youtube_trend, youtube_recommend = "", ""
-    if summerized_youtube_title_description:
-        try:
-            response = gemini_model_youtube(summerized_youtube_title_description)
-            if response:
-                response_json = json.loads(response.text)
-                youtube_trend = response_json.get("youtube_trend", "No trends available")
-                youtube_recommend = response_json.get("youtube_recommend", "No recommendations available")
-            else:
-                st.error("No response from Gemini for YouTube data")
-        except json.JSONDecodeError as e:
-            st.error(f"Error parsing YouTube Gemini response: {str(e)}")
-        except Exception as e:
-            st.error(f"Error processing YouTube summary: {str(e)}")
-    
-    message = (
+def render_brief(instagram_trend, instagram_recommend, youtube_trend, youtube_recommend):
+    return (
                     "<html><body>"
                     "<p>Here is the trend analysis with recommendations to win it:</p>"
                     "<p><b>Instagram Trends:</b><br>{instagram_trend}</p>"
@@ -216,41 +357,225 @@ def summarize_competitors(username):
                     youtube_trend=youtube_trend,
                     youtube_recommend=youtube_recommend
                 )
-    
-    summary_date=datetime.now(tz.tzutc())
-    with sqlite3.connect("users.db",check_same_thread=False) as conn:
-        cursor=conn.cursor()
-        cursor.execute("UPDATE users SET summary_date = ? WHERE username = ?", (summary_date, username))
-        conn.commit()
-    
-    return message
+
+BRIEF_SECTIONS = {
+    "instagram": ("Instagram", "instagram_trend", "instagram_recommend"),
+    "youtube": ("YouTube", "youtube_trend", "youtube_recommend"),
+}
+
+def local_brief_section(platform, handles):
+    """
+    Return (trend, recommendation) for one platform from the local trend
+    analysis of the summary window against the window before it.
+    """
+    from local_trends import analyze_posts, analyze_videos  # Deferred with numpy, like the engagement ranking
+
+    with metrics.span("brief.local", platform=platform):
+        if platform == "instagram":
+            return analyze_posts(load_posts(handles), load_posts(handles, previous=True))
+        return analyze_videos(load_videos(handles), load_videos(handles, previous=True))
+
+def _fallback_section(platform, handles):
+    metrics.increment("fallbacks", stage="brief.llm", platform=platform)
+    st.warning(f"No {BRIEF_SECTIONS[platform][0]} analysis from Gemini; showing the fast local analysis instead.")
+    return local_brief_section(platform, handles)
+
+def build_summary(username, verified_instagram_username, verified_youtube_handle, mode=None):
+    """
+    Build the trend brief for a user from the content already in the local store.
+    In "fast" mode the sections come from the local trend analysis; otherwise
+    from Gemini, falling back to the local analysis for a platform whose
+    response fails or takes longer than brief_llm_timeout.
+    """
+    handles = {"instagram": verified_instagram_username, "youtube": verified_youtube_handle}
+    if (mode or brief_mode) == "fast":
+        instagram, youtube = (local_brief_section(platform, handles[platform]) if handles[platform] else ("", "")
+                              for platform in BRIEF_SECTIONS)
+        return render_brief(*instagram, *youtube)
+
+    brief_requests = prepare_brief_requests(username, verified_instagram_username, verified_youtube_handle)
+
+    # Run both analyses in parallel
+    with metrics.span("brief.llm"):
+        responses = gemini_service.generate_batch(list(brief_requests), timeout=brief_llm_timeout)
+
+    return finish_brief(verified_instagram_username, verified_youtube_handle, brief_requests, responses)
+
+def finish_brief(verified_instagram_username, verified_youtube_handle, brief_requests, responses):
+    """
+    Render a brief from the (instagram, youtube) requests of prepare_brief_requests
+    and their Gemini responses. A platform whose response is None, because the
+    call failed or timed out, gets the local trend analysis instead.
+    """
+    instagram_request, youtube_request = brief_requests
+    instagram_response, youtube_response = responses
+
+    instagram_trend, instagram_recommend = "", ""
+    if instagram_request and instagram_response is None:
+        instagram_trend, instagram_recommend = _fallback_section("instagram", verified_instagram_username)
+    elif instagram_request:
+        instagram_trend, instagram_recommend = parse_brief(instagram_response, "Instagram", "instagram_trend", "instagram_recommend")
+    youtube_trend, youtube_recommend = "", ""
+    if youtube_request and youtube_response is None:
+        youtube_trend, youtube_recommend = _fallback_section("youtube", verified_youtube_handle)
+    elif youtube_request:
+        youtube_trend, youtube_recommend = parse_brief(youtube_response, "YouTube", "youtube_trend", "youtube_recommend")
+
+    return render_brief(instagram_trend, instagram_recommend, youtube_trend, youtube_recommend)
+
+INCOMPLETE_ESCAPE = re.compile(r"(?<!\\)((?:\\\\)*)\\(?:u[0-9a-fA-F]{0,3})?$")  # A trailing \ or \uXX cut off mid-escape
+
+def _partial_field(text, key):
+    # Read a string field out of JSON that may still be arriving, e.g. {"a": "partial val
+    marker = re.search(r'"%s"\s*:\s*"' % re.escape(key), text)
+    if not marker:
+        return ""
+    fragment, escaped = text[marker.end():], False
+    for index, char in enumerate(fragment):
+        if escaped:
+            escaped = False
+        elif char == "\\":
+            escaped = True
+        elif char == '"':
+            fragment = fragment[:index]
+            break
+    fragment = INCOMPLETE_ESCAPE.sub(r"\1", fragment)
+    try:
+        value = json.loads(f'"{fragment}"', strict=False)  # Models sometimes emit raw newlines inside strings
+    except ValueError:
+        return fragment  # Shown raw until the final parse rather than not at all
+    if value and "\ud800" <= value[-1] <= "\udbff":
+        value = value[:-1]  # First half of a surrogate pair; the second is still streaming
+    return value
+
+def _stream_section(platform, request, updates):
+    # Runs on a worker thread; the Streamlit thread renders whatever is put on the queue
+    text = ""
+    try:
+        for chunk in gemini_service.stream(request):
+            text += chunk
+            updates.put((platform, text, None, False))
+        updates.put((platform, text, None, True))
+    except Exception as e:
+        updates.put((platform, text, e, True))
+
+def summarize_competitors_streaming(username):
+    """
+    Summarize like summarize_competitors, but show fetch progress per platform
+    and render each trend and recommendation section while Gemini streams it.
+    Returns the brief as HTML once every section is complete.
+    """
+    verified_instagram_username, verified_youtube_handle = get_verified_handles(username)
+    handles = {"instagram": verified_instagram_username, "youtube": verified_youtube_handle}
+
+    totals = {platform: len(handles[platform]) for platform in BRIEF_SECTIONS}
+    done = {"instagram": 0, "youtube": 0}
+    with st.status("Fetching competitor content...", expanded=True) as status:
+        progress_lines = {platform: st.empty() for platform in totals if totals[platform]}
+
+        def on_result(result):
+            done[result.platform] += 1
+            label = BRIEF_SECTIONS[result.platform][0]
+            progress_lines[result.platform].write(f"{label}: {done[result.platform]} of {totals[result.platform]} accounts fetched")
+            if result.error:
+                st.error(f"Error fetching {label} data for {result.handle}: {str(result.error)}")
+
+        with quota_context(user=username), metrics.span("brief.fetch"):
+            fetch_competitor_content(verified_instagram_username, verified_youtube_handle, progress=on_result)
+        status.update(label="Competitor content fetched", state="complete", expanded=False)
+
+    with metrics.tagged(user=username):
+        requests_by_platform = dict(zip(BRIEF_SECTIONS, prepare_brief_requests(username, verified_instagram_username, verified_youtube_handle)))
+
+    # One heading and two placeholders per platform, filled in as text arrives
+    placeholders = {}
+    for platform, request in requests_by_platform.items():
+        if request:
+            label = BRIEF_SECTIONS[platform][0]
+            st.markdown(f"#### {label} Trends")
+            trend = st.empty()
+            st.markdown(f"#### {label} Recommendations")
+            placeholders[platform] = (trend, st.empty())
+            trend.caption("Analyzing...")
+
+    results = {platform: ("", "") for platform in BRIEF_SECTIONS}
+    updates = queue.Queue()
+    with metrics.span("brief.llm", mode="stream"):
+        workers = [threading.Thread(target=contextvars.copy_context().run, args=(_stream_section, platform, request, updates), daemon=True)
+                   for platform, request in requests_by_platform.items() if request]
+        for worker in workers:
+            worker.start()
+        pending = {platform for platform, request in requests_by_platform.items() if request}
+        deadline = time.monotonic() + brief_llm_timeout
+        while pending:
+            try:
+                platform, text, error, finished = updates.get(timeout=max(deadline - time.monotonic(), 0))
+            except queue.Empty:
+                # A stalled stream keeps its worker thread; the page moves on with the local analysis
+                for platform in sorted(pending):
+                    print(f"Gemini {BRIEF_SECTIONS[platform][0]} stream took longer than {brief_llm_timeout} seconds")
+                    results[platform] = _fallback_section(platform, handles[platform])
+                    placeholders[platform][0].markdown(results[platform][0])
+                    placeholders[platform][1].markdown(results[platform][1])
+                break
+            if platform not in pending:
+                continue
+            label, trend_key, recommend_key = BRIEF_SECTIONS[platform]
+            trend_placeholder, recommend_placeholder = placeholders[platform]
+            if not finished:
+                trend_placeholder.markdown(_partial_field(text, trend_key) or "Analyzing...")
+                recommend_placeholder.markdown(_partial_field(text, recommend_key))
+                continue
+            pending.discard(platform)
+            if error:
+                print(f"Error streaming {label} summary: {str(error)}")
+                results[platform] = _fallback_section(platform, handles[platform])
+            else:
+                results[platform] = parse_brief(CachedResponse(text) if text else None, label, trend_key, recommend_key)
+            trend_placeholder.markdown(results[platform][0])
+            recommend_placeholder.markdown(results[platform][1])
+
+    return render_brief(*results["instagram"], *results["youtube"])
+
+def mark_summarized(username, lease_owner=None):
+    """
+    Record that a brief was sent and release the user's auto-email lease.
+    With lease_owner, only updates the row if that worker still holds the lease.
+    Returns True if the row was updated.
+    """
+    summary_date=str(datetime.now(tz.tzutc()))  # UTC, so the scheduler can range-scan the index as text
+    if lease_owner:
+        cursor = db.execute(db.USERS, """
+            UPDATE users SET summary_date = ?, lease_owner = NULL, lease_expires_at = NULL, attempts = 0
+            WHERE username = ? AND lease_owner = ?
+        """, (summary_date, username, lease_owner))
+    else:
+        cursor = db.execute(db.USERS, """
+            UPDATE users SET summary_date = ?, lease_owner = NULL, lease_expires_at = NULL, attempts = 0
+            WHERE username = ?
+        """, (summary_date, username))
+    return cursor.rowcount == 1
 
 def send_mail(username,message):
     # Fetch user's email from database
     receiver_email_id = None
     try:
-        with sqlite3.connect("users.db", check_same_thread=False) as conn:
-            cursor = conn.cursor()
-            cursor.execute("SELECT email FROM users WHERE username=?", (username,))
-            result = cursor.fetchone()
-            if result:
-                receiver_email_id = result[0]
+        result = db.query_one(db.USERS, "SELECT email FROM users WHERE username=?", (username,))
+        if result:
+            receiver_email_id = result[0]
     except sqlite3.Error as e:
         st.error(f"Database error: {e}")
-    # Send email with summary
+    if not receiver_email_id:
+        st.error(f"No email address found for {username}")
+        return False
+    # Queue the summary; the mail sender delivers it in the background
     try:
-        s = smtplib.SMTP('smtp.gmail.com', 587)
-        s.starttls()
-        s.login(sender_email_id, sender_email_id_password)
-        msg = MIMEText(message, 'html')
-        msg['Subject'] = "Competitor Trend Analysis Report"
-        msg['From'] = sender_email_id
-        msg['To'] = receiver_email_id
-        s.send_message(msg)
-        s.quit()
-    except Exception as e:
-        st.error(f"Failed to send email: {str(e)}")
-    return None
+        with metrics.span("brief.enqueue", user=username):
+            enqueue_mail(receiver_email_id, "Competitor Trend Analysis Report", message)
+        return True
+    except sqlite3.Error as e:
+        st.error(f"Failed to queue email: {str(e)}")
+        return False
 
 def trend_analysis():
     if st.button("Back to Home", key="trend_analysis_back"):
@@ -318,24 +643,63 @@ def trend_analysis():
         st.session_state.competitors.append({})
         save_data(username, st.session_state.competitors)
 
-    # Fetching Instagram long-lived access token
-    try:
-        url = f"https://graph.facebook.com/v17.0/oauth/access_token?grant_type=fb_exchange_token&client_id={app_id}&client_secret={app_secret}&fb_exchange_token={user_access_token}"
-        response = requests.get(url)
-        response.raise_for_status()
-        long_access_token = response.json().get("access_token")
-    except requests.exceptions.HTTPError as e:
-        long_access_token = None
-    except Exception as e:
-        long_access_token = None
+    # Bulk import and verification
+    with st.expander("Bulk import and verify"):
+        uploaded = st.file_uploader("CSV with username, youtube, instagram columns", type="csv", key="bulk_csv")
+        pasted = st.text_area("Or paste rows (username, youtube, instagram)", key="bulk_rows")
+        bulk_cols = st.columns(2)
+        with bulk_cols[0]:
+            import_clicked = st.button("Import and verify", use_container_width=True)
+        with bulk_cols[1]:
+            verify_all_clicked = st.button("Verify all unverified rows", use_container_width=True)
+        if import_clicked or verify_all_clicked:
+            if import_clicked:
+                text = uploaded.getvalue().decode("utf-8-sig") if uploaded else pasted
+                rows = parse_competitor_rows(text or "")
+                if not rows:
+                    st.warning("No rows to import.")
+            else:
+                rows = []
+                for row, item in enumerate(st.session_state.competitors):
+                    if item.get('verified'):
+                        continue
+                    # Handles typed into a row live in the widget state until the row is verified
+                    item['youtube'] = st.session_state.get(f'youtube_{row}', item.get('youtube', ''))
+                    item['instagram'] = st.session_state.get(f'instagram_{row}', item.get('instagram', ''))
+                    if item['youtube'] or item['instagram']:
+                        rows.append(item)
+            if rows:
+                with st.spinner(f"Verifying {len(rows)} competitors..."):
+                    with quota_context(user=username):
+                        problems = verify_rows(rows)
+                if import_clicked:
+                    st.session_state.competitors.extend(rows)
+                save_data(username, st.session_state.competitors)  # One transaction for every result
+                verified_count = sum(1 for item in rows if item['verified'])
+                st.success(f"Verified {verified_count} of {len(rows)} competitors.")
+                if problems:
+                    st.warning("\n\n".join(problems))
 
     # Summarize button
     col1, col2, col3 = st.columns([0.1, 2, 0.1])
     with col2:
+        fast_brief = st.radio("Brief", ["Full analysis", "Fast brief"], horizontal=True, key="brief_mode",
+                              index=1 if brief_mode == "fast" else 0,
+                              help="The fast brief counts hashtags, phrases and topics locally instead of asking Gemini.") == "Fast brief"
+        stream_results = not fast_brief and st.toggle("Show results as they arrive", value=True, key="stream_summary")
         if st.button("Summarize"):
             st.markdown("### Summary of Verified Competitors")
-            message_summary=summarize_competitors(username)
-            mail=send_mail(username,message_summary)
-            st.success(f"Summary sent mail successfully!")
+            with metrics.span("brief.total", user=username, mode="fast" if fast_brief else "stream" if stream_results else "batch"):
+                if fast_brief:
+                    message_summary=summarize_competitors(username, mode="fast")
+                    st.html(message_summary)
+                elif stream_results:
+                    message_summary=summarize_competitors_streaming(username)
+                else:
+                    message_summary=summarize_competitors(username, mode="llm")
+                queued=send_mail(username,message_summary)  # Delivered by the background sender
+            if queued:
+                mark_summarized(username)
+                st.success(f"Summary queued for email!")
         else:
             st.write("No summary.")
@@ -1,22 +1,226 @@
-import sqlite3
 from datetime import datetime,timedelta
-from app import summarize_competitors,send_mail
-
-def send_auto_email():
-    result=None
-    with sqlite3.connect("users.db",check_same_thread=False) as conn:
-        cursor=conn.cursor()
-        cursor.execute("SELECT username,summary_date FROM users WHERE summary_date IS NOT NULL")
-        result=cursor.fetchall()
-        print(result)
-        for i in range(len(result)):
-            username=result[i][0]
-            summary_datetime = datetime.fromisoformat(result[i][1].replace('Z', '+00:00'))
-            check_time_thresshold=48
-            current_time = datetime.now(summary_datetime.tzinfo)
-            time_difference = current_time - summary_datetime
-            hours_difference = time_difference.total_seconds() / 3600
-            if hours_difference >= check_time_thresshold:
-                mess=summarize_competitors(username)
-                send_mail(username,mess)
-    return None
+from dateutil import tz
+import os
+import socket
+import time
+from dotenv import load_dotenv
+import db
+import metrics
+from app import get_verified_handles,build_summary,prepare_brief_requests,finish_brief,send_mail,mark_summarized,brief_mode,brief_llm_timeout
+from gemini_service import gemini_service
+from fetcher import fetch_competitor_content
+from youtube_quota import QuotaExceeded,quota_context,can_spend,estimate_fetch,youtube_quota_defer_seconds,LOW
+
+# Load environment variables
+load_dotenv()
+lease_seconds=int(os.getenv("auto_email_lease_seconds","900"))
+retry_delay_seconds=int(os.getenv("auto_email_retry_delay","600"))
+max_attempts=int(os.getenv("auto_email_max_attempts","5"))
+attempts_cooldown=int(os.getenv("auto_email_attempts_cooldown","21600"))  # seconds before a user at max_attempts is tried again
+
+CHECK_TIME_THRESHOLD = timedelta(hours=48)
+
+# Users under max_attempts, or past the cooldown since their last failed attempt; bound to (now, max_attempts, now - cooldown)
+CLAIMABLE_SQL="(attempts < ? OR COALESCE(lease_expires_at,0) < ?)"
+
+def parse_summary_date(summary_date):
+    return datetime.fromisoformat(summary_date.replace('Z', '+00:00'))
+
+def load_upcoming(limit):
+    """
+    Return (due_at, username) for the users with the oldest briefs, via the summary_date index.
+    """
+    rows=db.query(db.USERS,"SELECT username,summary_date FROM users WHERE summary_date IS NOT NULL ORDER BY summary_date LIMIT ?",(limit,))
+    return [(parse_summary_date(summary_date)+CHECK_TIME_THRESHOLD,username) for username,summary_date in rows]
+
+def next_claim_at(now=None):
+    """
+    Return when the next user can be claimed, or None if no user is waiting.
+    Uses the same filters as claim_due_users: leased, retrying and deferred
+    users count from their lease expiry, and users at max_attempts from the
+    end of their cooldown.
+    """
+    now=now or datetime.now(tz.tzutc())
+    row=db.query_one(db.USERS,f"""
+        SELECT summary_date FROM users
+        WHERE summary_date IS NOT NULL AND (lease_owner IS NULL OR lease_expires_at < ?) AND {CLAIMABLE_SQL}
+        ORDER BY summary_date LIMIT 1
+    """,(now.timestamp(),max_attempts,now.timestamp()-attempts_cooldown))
+    candidates=[parse_summary_date(row[0])+CHECK_TIME_THRESHOLD] if row else []
+    row=db.query_one(db.USERS,"""
+        SELECT MIN(CASE WHEN attempts >= ? THEN lease_expires_at + ? ELSE lease_expires_at END) FROM users
+        WHERE summary_date IS NOT NULL AND lease_expires_at IS NOT NULL
+            AND (CASE WHEN attempts >= ? THEN lease_expires_at + ? ELSE lease_expires_at END) >= ?
+    """,(max_attempts,attempts_cooldown,max_attempts,attempts_cooldown,now.timestamp()))
+    if row and row[0] is not None:
+        candidates.append(datetime.fromtimestamp(row[0],tz.tzutc()))
+    return min(candidates) if candidates else None
+
+def claim_due_users(owner,limit,usernames=None,now=None):
+    """
+    Atomically lease up to limit due users to owner and return their usernames.
+    Users whose lease has expired can be claimed again; users that have failed
+    max_attempts times are left alone until attempts_cooldown has passed since
+    their last attempt, then start over. With usernames, only those users are considered.
+    """
+    now=now or datetime.now(tz.tzutc())
+    cutoff=str(now-CHECK_TIME_THRESHOLD)
+    lease_until=time.time()+lease_seconds
+    filter_sql,filter_args="",()
+    if usernames is not None:
+        if not usernames:
+            return []
+        filter_sql=f" AND username IN ({','.join('?' for _ in usernames)})"
+        filter_args=tuple(usernames)
+    with db.transaction(db.USERS,immediate=True) as conn:
+        cursor=conn.execute(f"""
+            SELECT username,attempts FROM users
+            WHERE summary_date IS NOT NULL AND summary_date <= ?
+                AND (lease_owner IS NULL OR lease_expires_at < ?)
+                AND {CLAIMABLE_SQL}{filter_sql}
+            ORDER BY summary_date LIMIT ?
+        """,(cutoff,time.time(),max_attempts,time.time()-attempts_cooldown,*filter_args,limit))
+        rows=cursor.fetchall()
+        conn.executemany("UPDATE users SET lease_owner=?, lease_expires_at=?, attempts=? WHERE username=?",
+                         [(owner,lease_until,1 if attempts>=max_attempts else attempts+1,username) for username,attempts in rows])
+    for username,attempts in rows:
+        if attempts>=max_attempts:
+            print(f"Auto-email: retrying {username} after {attempts} failed attempts and a cooldown")
+            metrics.increment("attempt_resets",stage="cycle.claim")
+    return [username for username,_ in rows]
+
+def count_stuck_users():
+    """
+    Return the number of users whose scheduled briefs are paused after max_attempts failures.
+    """
+    return db.query_one(db.USERS,"SELECT COUNT(*) FROM users WHERE attempts >= ? AND COALESCE(lease_expires_at,0) >= ?",
+                        (max_attempts,time.time()-attempts_cooldown))[0]
+
+def renew_lease(username,owner):
+    """
+    Extend owner's lease on a user. Returns False if the lease was lost to another worker.
+    """
+    cursor=db.execute(db.USERS,"UPDATE users SET lease_expires_at=? WHERE username=? AND lease_owner=?",
+                      (time.time()+lease_seconds,username,owner))
+    return cursor.rowcount==1
+
+def release_for_retry(username,owner):
+    # Keep the lease until the retry delay passes, so the failed user is not picked up straight away
+    db.execute(db.USERS,"UPDATE users SET lease_expires_at=? WHERE username=? AND lease_owner=?",
+               (time.time()+retry_delay_seconds,username,owner))
+
+def defer(username,owner,delay=youtube_quota_defer_seconds):
+    # Hold the lease without counting an attempt; the user was skipped, not failed
+    db.execute(db.USERS,"UPDATE users SET lease_expires_at=?, attempts=MAX(attempts-1,0) WHERE username=? AND lease_owner=?",
+               (time.time()+delay,username,owner))
+
+def worker_id(suffix=""):
+    return f"{socket.gethostname()}:{os.getpid()}{suffix}"
+
+def send_auto_email(batch_size=100):
+    """
+    Lease every due user in batches and send their briefs. Safe to run next to
+    scheduler workers: users leased elsewhere are skipped.
+    """
+    owner=worker_id()
+    while True:
+        due_users=claim_due_users(owner,batch_size)
+        print(f"Auto-email: {len(due_users)} users claimed")
+        if not due_users:
+            return None
+        run_cycle(due_users,owner)
+
+def run_cycle(usernames,owner=None):
+    """
+    Plan a whole auto-email cycle: fetch the union of every due user's verified
+    handles exactly once, send every user's Gemini requests as one batch, then
+    build and send each user's brief from that shared pool.
+    With owner, usernames must be leased to that worker; a brief is only sent while
+    the lease is still held, and summary_date is committed after the mail is sent.
+    Returns the usernames whose brief was sent.
+    """
+    if not usernames:
+        return []
+    with metrics.span("cycle.total",users=len(usernames)) as fields:
+        sent=_run_cycle(usernames,owner)
+        fields["sent"]=len(sent)
+    return sent
+
+def _run_cycle(usernames,owner):
+    plans={username:get_verified_handles(username) for username in usernames}
+    instagram_usernames=list(dict.fromkeys(handle for insta,_ in plans.values() for handle in insta))  # Distinct, order kept
+    youtube_handles=list(dict.fromkeys(handle for _,yt in plans.values() for handle in yt))
+    print(f"Auto-email cycle: {len(usernames)} users, {len(instagram_usernames)} Instagram and {len(youtube_handles)} YouTube handles")
+
+    # Scheduled briefs are low priority: they keep out of the interactive reserve and are paced over the day
+    if owner and youtube_handles and not can_spend(estimate_fetch(len(youtube_handles)),LOW):
+        # Only users following YouTube channels wait for the budget; Instagram-only users still get their brief
+        deferred=[username for username in usernames if plans[username][1]]
+        print(f"Auto-email: YouTube quota budget reached, deferring {len(deferred)} users")
+        for username in deferred:
+            defer(username,owner)
+        usernames=[username for username in usernames if not plans[username][1]]
+        if not usernames:
+            return []
+        instagram_usernames=list(dict.fromkeys(handle for username in usernames for handle in plans[username][0]))
+        youtube_handles=[]
+    with quota_context(user="scheduler",priority=LOW),metrics.span("cycle.fetch",users=len(usernames)):
+        instagram_results,youtube_results=fetch_competitor_content(instagram_usernames,youtube_handles)
+    for result in instagram_results+youtube_results:
+        if result.error:
+            print(f"Error fetching {result.platform} data for {result.handle}: {str(result.error)}")
+    over_quota={result.handle for result in youtube_results if isinstance(result.error,QuotaExceeded)}
+
+    briefs={}  # username -> (instagram_request, youtube_request), or None for a fast brief
+    for username in usernames:
+        if over_quota.intersection(plans[username][1]):
+            print(f"Deferring {username}: YouTube quota budget reached mid-cycle")  # Rather than send a partial brief
+            if owner:
+                defer(username,owner)
+            continue
+        if brief_mode=="fast":
+            briefs[username]=None
+            continue
+        try:
+            with metrics.tagged(user=username):
+                briefs[username]=prepare_brief_requests(username,*plans[username])
+        except Exception as e:
+            _build_failed(username,owner,e)
+
+    # Every user's requests go out in one batch, so Gemini round-trips overlap under the service's concurrency and rate limits
+    responses={}
+    brief_requests=[request for pair in briefs.values() if pair for request in pair]
+    if brief_requests:
+        queued=sum(request is not None for request in brief_requests)
+        # Requests wait for the rate limiter before their call starts; the timeout allows for that, within the lease
+        timeout=min(brief_llm_timeout+60*queued/gemini_service.requests_per_minute,lease_seconds*0.8)
+        with metrics.span("cycle.llm",users=len(briefs),requests=queued):
+            generated=iter(gemini_service.generate_batch(brief_requests,timeout=timeout))
+        responses={username:(next(generated),next(generated)) for username,pair in briefs.items() if pair}
+
+    sent=[]
+    for username,pair in briefs.items():
+        try:
+            with metrics.tagged(user=username):
+                if pair is None:
+                    mess=build_summary(username,*plans[username])
+                else:
+                    mess=finish_brief(*plans[username],pair,responses[username])
+        except Exception as e:
+            _build_failed(username,owner,e)
+            continue
+        if owner and not renew_lease(username,owner):
+            print(f"Lease for {username} was lost, skipping send")
+            continue
+        if send_mail(username,mess):
+            mark_summarized(username,owner)
+            sent.append(username)
+        elif owner:
+            release_for_retry(username,owner)
+    return sent
+
+def _build_failed(username,owner,error):
+    print(f"Error building brief for {username}: {str(error)}")
+    metrics.increment("failures",stage="brief.build")
+    if owner:
+        release_for_retry(username,owner)
@@ -0,0 +1,237 @@
+"""
+Local stand-ins for the services the brief pipeline talks to: a YouTube Data
+API stub (used with the bundled static discovery document), a Graph API stub,
+a fake Gemini client and an SMTP sink. Each server listens on 127.0.0.1 on a
+free port and runs in a daemon thread.
+"""
+import json
+import time
+import threading
+import socketserver
+from datetime import datetime, timedelta
+from dateutil import tz
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+ITEMS_PER_PAGE = 10
+
+def _recent(index, spacing_hours=3):
+    # Newest first, one item every few hours, so part of each page is inside the 48h window
+    return (datetime.now(tz.tzutc()) - timedelta(hours=1 + index * spacing_hours)).isoformat(timespec="seconds")
+
+def _caption(handle, index):
+    return (f"New drop from {handle} #{index} - behind the scenes of our latest launch. "
+            f"#launch #{handle} #trend{index % 4} #style\nhttps://example.com/{handle}/{index}")
+
+class _StubServer:
+    handler = None
+
+    def __init__(self, latency=0.0):
+        self.latency = latency
+        handler = type("Handler", (self.handler,), {"stub": self})
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+        self.server.daemon_threads = True
+        self.calls = 0
+        self.lock = threading.Lock()
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self.server.server_address[1]}"
+
+    def start(self):
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def count(self):
+        with self.lock:
+            self.calls += 1
+        if self.latency:
+            time.sleep(self.latency)
+
+class _JsonHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # Keep-alive, like the real APIs
+
+    def send_json(self, body, status=200):
+        data = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass
+
+class _YouTubeHandler(_JsonHandler):
+    def do_GET(self):
+        self.stub.count()
+        url = urlparse(self.path)
+        query = {key: values[0] for key, values in parse_qs(url.query).items()}
+        resource = url.path.rstrip("/").rsplit("/", 1)[-1]
+        if resource == "channels":
+            handle = query.get("forHandle", "").lstrip("@")
+            self.send_json({"items": [{"id": f"UC{handle}", "contentDetails": {"relatedPlaylists": {"uploads": f"UU{handle}"}}}]})
+        elif resource == "playlistItems":
+            handle = query["playlistId"][2:]
+            page = int(query.get("pageToken") or 0)
+            items = []
+            for index in range(page * ITEMS_PER_PAGE, (page + 1) * ITEMS_PER_PAGE):
+                video_id = f"{handle}-v{index}"
+                items.append({
+                    "snippet": {"title": f"{handle} video {index}", "description": _caption(handle, index),
+                                "publishedAt": _recent(index), "resourceId": {"videoId": video_id}},
+                    "contentDetails": {"videoId": video_id, "videoPublishedAt": _recent(index)},
+                })
+            self.send_json({"items": items, "nextPageToken": str(page + 1) if page < 4 else None})
+        elif resource == "videos":
+            items = [{"id": video_id, "contentDetails": {"duration": "PT4M13S"},
+                      "statistics": {"viewCount": str(1000 + i * 37), "likeCount": str(100 + i), "commentCount": str(i)}}
+                     for i, video_id in enumerate(query.get("id", "").split(","))]
+            self.send_json({"items": items})
+        else:
+            self.send_json({"error": {"code": 404, "message": "Not found"}}, status=404)
+
+class YouTubeStub(_StubServer):
+    """
+    Answers channels, playlistItems and videos list calls for any handle.
+    Point youtube_api_endpoint at its url.
+    """
+    handler = _YouTubeHandler
+
+def _business_discovery(fields):
+    username = fields.split("business_discovery.username(", 1)[1].split(")", 1)[0]
+    after = fields.split("media.after(", 1)[1].split(")", 1)[0] if "media.after(" in fields else None
+    page = int(after) if after else 0
+    posts = [{"id": f"{username}-p{index}", "caption": _caption(username, index), "timestamp": _recent(index),
+              "like_count": 50 + index} for index in range(page * ITEMS_PER_PAGE, (page + 1) * ITEMS_PER_PAGE)]
+    media = {"data": posts}
+    if page < 4:
+        media["paging"] = {"cursors": {"after": str(page + 1)}, "next": "more"}
+    return {"business_discovery": {"id": f"ig-{username}", "media": media}, "id": "benchmark"}
+
+class _GraphHandler(_JsonHandler):
+    def do_GET(self):
+        self.stub.count()
+        query = {key: values[0] for key, values in parse_qs(urlparse(self.path).query).items()}
+        self.send_json(_business_discovery(query.get("fields", "")))
+
+    def do_POST(self):
+        self.stub.count()
+        length = int(self.headers.get("Content-Length", 0))
+        form = {key: values[0] for key, values in parse_qs(self.rfile.read(length).decode()).items()}
+        responses = []
+        for sub_request in json.loads(form.get("batch", "[]")):
+            query = {key: values[0] for key, values in parse_qs(urlparse(sub_request["relative_url"]).query).items()}
+            responses.append({"code": 200, "body": json.dumps(_business_discovery(query.get("fields", "")))})
+        self.send_json(responses)
+
+class GraphStub(_StubServer):
+    """
+    Answers business_discovery lookups, single or batched. Point graph_api_url at its url.
+    """
+    handler = _GraphHandler
+
+class FakeGeminiResponse:
+    def __init__(self, text):
+        self.text = text
+
+class FakeGenerativeModel:
+    def __init__(self, fake, model_name=None, generation_config=None, system_instruction=None):
+        self.fake = fake
+        self.system_instruction = system_instruction or ""
+
+    def generate_content(self, prompt, stream=False):
+        platform = "instagram" if "instagram" in self.system_instruction.lower() else "youtube"
+        text = json.dumps({
+            f"{platform}_trend": f"Benchmark {platform} trend over {len(str(prompt))} characters",
+            f"{platform}_recommend": f"Benchmark {platform} recommendation",
+        })
+        if stream:
+            return self._stream(text)
+        self.fake.count()
+        return FakeGeminiResponse(text)
+
+    def _stream(self, text, chunks=8):
+        # Same total latency as a whole response, spread over the chunks
+        self.fake.count(delay=False)
+        size = -(-len(text) // chunks)
+        for start in range(0, len(text), size):
+            time.sleep(self.fake.latency / chunks)
+            yield FakeGeminiResponse(text[start:start + size])
+
+class FakeGemini:
+    """
+    Drop-in for the google.generativeai module with a fixed latency per call.
+    Install with gemini_service._client = lambda: fake.
+    """
+
+    def __init__(self, latency=0.5):
+        self.latency = latency
+        self.calls = 0
+        self.lock = threading.Lock()
+
+    def count(self, delay=True):
+        with self.lock:
+            self.calls += 1
+        if delay:
+            time.sleep(self.latency)
+
+    def GenerativeModel(self, **kwargs):
+        return FakeGenerativeModel(self, **kwargs)
+
+class _SmtpHandler(socketserver.StreamRequestHandler):
+    def reply(self, line):
+        self.wfile.write(f"{line}\r\n".encode())
+
+    def handle(self):
+        self.reply("220 benchmark SMTP sink")
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+            command = line.decode(errors="replace").strip().upper()
+            if command.startswith(("EHLO", "HELO")):
+                self.reply("250 benchmark")
+            elif command == "DATA":
+                self.reply("354 End data with <CR><LF>.<CR><LF>")
+                while self.rfile.readline() not in (b".\r\n", b".\n", b""):
+                    pass
+                self.server.sink.count()
+                self.reply("250 OK")
+            elif command == "QUIT":
+                self.reply("221 Bye")
+                return
+            else:
+                self.reply("250 OK")  # MAIL, RCPT, RSET and NOOP
+
+class SmtpSink:
+    """
+    Accepts and discards mail. Point smtp_host and smtp_port at it with smtp_starttls=false.
+    """
+
+    def __init__(self):
+        self.server = socketserver.ThreadingTCPServer(("127.0.0.1", 0), _SmtpHandler)
+        self.server.daemon_threads = True
+        self.server.sink = self
+        self.messages = 0
+        self.lock = threading.Lock()
+
+    @property
+    def port(self):
+        return self.server.server_address[1]
+
+    def count(self):
+        with self.lock:
+            self.messages += 1
+
+    def start(self):
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
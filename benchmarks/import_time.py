@@ -0,0 +1,61 @@
+"""
+Cold-start benchmark for the Streamlit entry point.
+
+Each measurement runs in a fresh interpreter so nothing is already imported.
+It reports how long importing each page module takes, and what the lazily
+created clients cost on their first use. Dummy API keys are set when none
+are configured; no network calls are made.
+
+    python benchmarks/import_time.py --runs 5
+"""
+import os
+import sys
+import json
+import argparse
+import statistics
+import subprocess
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Statements timed in a fresh interpreter, after streamlit itself is imported
+SCENARIOS = {
+    "import login": "import login",
+    "import app": "import app",
+    "import all pages": "import login, home, dashboard, app",
+    "first YouTube client": "import youtube_data_api; youtube_data_api.get_youtube()",
+    "first Gemini client": "from gemini_service import gemini_service; gemini_service._client()",
+}
+
+SCRIPT = """
+import sys, time, json
+sys.path.insert(0, {root!r})
+import streamlit
+start = time.perf_counter()
+{statement}
+print(json.dumps(time.perf_counter() - start))
+"""
+
+def measure(statement, workdir):
+    env = dict(os.environ)
+    env.setdefault("youtube_data_api", "benchmark-key")
+    env.setdefault("gemini_api_key", "benchmark-key")
+    completed = subprocess.run(
+        [sys.executable, "-c", SCRIPT.format(root=ROOT, statement=statement)],
+        cwd=workdir, env=env, capture_output=True, text=True, check=True
+    )
+    return json.loads(completed.stdout.strip().splitlines()[-1])
+
+def main():
+    arg_parser = argparse.ArgumentParser(description="Measure cold import and first-use times.")
+    arg_parser.add_argument("--runs", type=int, default=5, help="fresh interpreters per scenario")
+    args = arg_parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as workdir:  # Keeps benchmark databases out of the project
+        print(f"{'scenario':<24}{'median ms':>12}{'min ms':>10}")
+        for name, statement in SCENARIOS.items():
+            timings = [measure(statement, workdir) * 1000 for _ in range(args.runs)]
+            print(f"{name:<24}{statistics.median(timings):>12.1f}{min(timings):>10.1f}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,199 @@
+"""
+Offline end-to-end benchmark for the brief pipeline.
+
+Each scale runs in a fresh interpreter against fresh databases seeded with
+N users of M competitors each. YouTube, the Graph API, Gemini and SMTP are
+replaced by the local stand-ins in fakes.py. Two numbers are measured:
+
+- summarize_competitors latency for a user clicking Summarize
+- send_auto_email throughput for a full cycle, including draining the outbox
+
+Results are compared with benchmarks/baseline.json and the run fails when a
+number regresses by more than the tolerance.
+
+    python benchmarks/pipeline.py
+    python benchmarks/pipeline.py --scales 10x4,50x8 --gemini-latency 0.5
+    python benchmarks/pipeline.py --update-baseline
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import statistics
+import subprocess
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BASELINE = os.path.join(ROOT, "benchmarks", "baseline.json")
+SUMMARIZE_SAMPLES = 5
+
+# Whether a larger value is better, per metric compared against the baseline
+DIRECTIONS = {
+    "summarize_p50_ms": False,
+    "summarize_p95_ms": False,
+    "cycle_users_per_second": True,
+}
+
+def _configure(workdir, youtube_url, graph_url, smtp_port):
+    os.environ.update({
+        "users_db_path": os.path.join(workdir, "users.db"),
+        "competitors_db_path": os.path.join(workdir, "competitors.db"),
+        "youtube_data_api": "benchmark-key",
+        "youtube_api_endpoint": youtube_url,
+        "youtube_daily_quota": str(10 ** 9),
+        "graph_api_url": graph_url,
+        "ig_user_id": "benchmark",
+        "long_access_token": "benchmark-token",
+        "gemini_api_key": "benchmark-key",
+        "gemini_requests_per_minute": str(10 ** 6),
+        "smtp_host": "127.0.0.1",
+        "smtp_port": str(smtp_port),
+        "smtp_starttls": "false",
+        "sender_email_id": "briefs@benchmark.local",
+        "metrics_log_file": os.devnull,  # Span logs would dominate the output
+    })
+
+def _seed(db, users, competitors, extra_users):
+    old = "2000-01-01 00:00:00+00:00"
+    recent = "2999-01-01 00:00:00+00:00"  # Summarize samples must not be picked up by the auto-email cycle
+    names = [f"user{u}" for u in range(users)] + [f"sample{u}" for u in range(extra_users)]
+    with db.transaction(db.USERS) as conn:
+        conn.executemany("INSERT INTO users (username, password, email, summary_date) VALUES (?, '', ?, ?)",
+                         [(name, f"{name}@benchmark.local", old if name.startswith("user") else recent) for name in names])
+    with db.transaction(db.COMPETITORS) as conn:
+        conn.executemany("INSERT INTO competitors (user_id, username, youtube, instagram, verified) VALUES (?, ?, ?, ?, 1)",
+                         [(name, f"{name}-c{c}", f"@{name}c{c}", f"{name}c{c}") for name in names for c in range(competitors)])
+    return names
+
+def run_scale(users, competitors, api_latency, gemini_latency):
+    """
+    Measure one scale in this process and return its results. Must run in a
+    fresh interpreter: the app modules read their settings at import.
+    """
+    sys.path.insert(0, ROOT)
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    from fakes import YouTubeStub, GraphStub, FakeGemini, SmtpSink
+
+    youtube_stub = YouTubeStub(api_latency).start()
+    graph_stub = GraphStub(api_latency).start()
+    smtp_sink = SmtpSink().start()
+    gemini = FakeGemini(gemini_latency)
+    with tempfile.TemporaryDirectory() as workdir:
+        _configure(workdir, youtube_stub.url, graph_stub.url, smtp_sink.port)
+        os.chdir(workdir)
+        import db
+        import app
+        import mailer
+        import auto_email
+        from gemini_service import gemini_service
+        gemini_service._client = lambda: gemini
+
+        names = _seed(db, users, competitors, SUMMARIZE_SAMPLES)
+
+        latencies = []
+        for name in names[users:]:
+            start = time.perf_counter()
+            app.send_mail(name, app.summarize_competitors(name))
+            latencies.append((time.perf_counter() - start) * 1000)
+        while mailer.send_pending():
+            pass
+        sent_before = smtp_sink.messages
+
+        start = time.perf_counter()
+        auto_email.send_auto_email()
+        while mailer.send_pending():
+            pass
+        cycle_seconds = time.perf_counter() - start
+        delivered = smtp_sink.messages - sent_before
+        db.connect(db.USERS).close()
+        db.connect(db.COMPETITORS).close()
+
+    for server in (youtube_stub, graph_stub, smtp_sink):
+        server.stop()
+    latencies.sort()
+    return {
+        "summarize_p50_ms": round(statistics.median(latencies), 1),
+        "summarize_p95_ms": round(latencies[min(len(latencies) - 1, int(0.95 * len(latencies)))], 1),
+        "cycle_seconds": round(cycle_seconds, 3),
+        "cycle_users_per_second": round(delivered / cycle_seconds, 2) if cycle_seconds else 0.0,
+        "delivered": delivered,
+        "calls": {"youtube": youtube_stub.calls, "graph": graph_stub.calls, "gemini": gemini.calls},
+    }
+
+def _scale_key(scale, args):
+    return f"{scale}@api{args.api_latency}s,gemini{args.gemini_latency}s"
+
+def compare(results, baseline, tolerance):
+    """
+    Return a list of regression messages for results worse than the baseline by more than tolerance.
+    """
+    regressions = []
+    for key, measured in results.items():
+        expected = baseline.get(key)
+        if not expected:
+            continue
+        for metric, higher_is_better in DIRECTIONS.items():
+            if not expected.get(metric):
+                continue
+            change = (measured[metric] - expected[metric]) / expected[metric]
+            if (-change if higher_is_better else change) > tolerance:
+                regressions.append(f"{key} {metric}: {measured[metric]} vs baseline {expected[metric]} ({change:+.0%})")
+    return regressions
+
+def main():
+    arg_parser = argparse.ArgumentParser(description="Benchmark the brief pipeline against local fakes.")
+    arg_parser.add_argument("--scales", default="5x4,20x4", help="comma-separated USERSxCOMPETITORS scales")
+    arg_parser.add_argument("--api-latency", type=float, default=0.02, help="seconds added to each fake YouTube and Graph API call")
+    arg_parser.add_argument("--gemini-latency", type=float, default=0.2, help="seconds per fake Gemini call")
+    arg_parser.add_argument("--tolerance", type=float, default=0.25, help="allowed regression before failing, as a fraction")
+    arg_parser.add_argument("--update-baseline", action="store_true", help="store these results as the new baseline")
+    arg_parser.add_argument("--run-scale", help=argparse.SUPPRESS)  # Child process entry point
+    args = arg_parser.parse_args()
+
+    if args.run_scale:
+        users, competitors = (int(part) for part in args.run_scale.split("x"))
+        print(json.dumps(run_scale(users, competitors, args.api_latency, args.gemini_latency)))
+        return 0
+
+    results = {}
+    print(f"{'scale':<12}{'p50 ms':>10}{'p95 ms':>10}{'cycle s':>10}{'users/s':>10}  calls")
+    for scale in args.scales.split(","):
+        completed = subprocess.run(
+            [sys.executable, os.path.abspath(__file__), "--run-scale", scale,
+             "--api-latency", str(args.api_latency), "--gemini-latency", str(args.gemini_latency)],
+            capture_output=True, text=True
+        )
+        if completed.returncode != 0:
+            print(completed.stderr)
+            return completed.returncode
+        result = json.loads(completed.stdout.strip().splitlines()[-1])
+        results[_scale_key(scale, args)] = result
+        print(f"{scale:<12}{result['summarize_p50_ms']:>10}{result['summarize_p95_ms']:>10}"
+              f"{result['cycle_seconds']:>10}{result['cycle_users_per_second']:>10}  {result['calls']}")
+
+    if args.update_baseline:
+        baseline = {}
+        if os.path.exists(BASELINE):
+            with open(BASELINE) as f:
+                baseline = json.load(f)
+        baseline.update(results)
+        with open(BASELINE, "w") as f:
+            json.dump(baseline, f, indent=2, sort_keys=True)
+            f.write("\n")
+        print(f"Baseline updated: {BASELINE}")
+        return 0
+
+    if not os.path.exists(BASELINE):
+        print("No baseline yet; run with --update-baseline to store one.")
+        return 0
+    with open(BASELINE) as f:
+        regressions = compare(results, json.load(f), args.tolerance)
+    for message in regressions:
+        print(f"REGRESSION {message}")
+    if not regressions:
+        print("No regressions against the baseline.")
+    return 1 if regressions else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
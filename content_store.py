@@ -0,0 +1,164 @@
+import os
+import time
+from datetime import datetime, timedelta
+from dateutil import parser, tz
+from dotenv import load_dotenv
+from youtube_data_api import Video
+import db
+
+# Load environment variables
+load_dotenv()
+summary_window_hours = int(os.getenv("summary_window_hours", "48"))
+
+def to_utc_iso(timestamp):
+    """
+    Normalize an API timestamp to a sortable UTC ISO string, or None if it cannot be parsed.
+    """
+    try:
+        return parser.isoparse(timestamp).astimezone(tz.tzutc()).isoformat(timespec="seconds")
+    except (TypeError, ValueError):
+        return None
+
+def window_start(hours=None):
+    """
+    Return the UTC ISO timestamp at the start of the summary window.
+    """
+    start = datetime.now(tz.tzutc()) - timedelta(hours=hours or summary_window_hours)
+    return start.isoformat(timespec="seconds")
+
+def get_watermarks(platform, handles):
+    """
+    Return {handle: last_seen_id} for the handles that have been fetched before.
+    """
+    if not handles:
+        return {}
+    placeholders = ",".join("?" for _ in handles)
+    return dict(db.query(
+        db.COMPETITORS,
+        f"SELECT handle, last_seen_id FROM watermarks WHERE platform = ? AND handle IN ({placeholders})",
+        (platform, *handles)
+    ))
+
+def _newest(items):
+    dated = [item for item in items if item[1]]
+    return max(dated, key=lambda item: item[1]) if dated else None
+
+def _save(platform, rows, newest_by_handle):
+    now = time.time()
+    with db.transaction(db.COMPETITORS) as conn:
+        cursor = conn.cursor()
+        cursor.executemany("""
+            INSERT INTO content (platform, item_id, handle, caption, title, description, likes, views, comments, duration, published_at, fetched_at)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            ON CONFLICT(platform, item_id) DO UPDATE SET
+                caption = excluded.caption,
+                title = excluded.title,
+                description = excluded.description,
+                likes = COALESCE(excluded.likes, content.likes),
+                views = COALESCE(excluded.views, content.views),
+                comments = COALESCE(excluded.comments, content.comments),
+                duration = COALESCE(excluded.duration, content.duration),
+                fetched_at = excluded.fetched_at
+        """, [(platform, *row, now) for row in rows])
+        cursor.executemany("""
+            INSERT INTO watermarks (platform, handle, last_seen_id, last_seen_at, checked_at)
+            VALUES (?, ?, ?, ?, ?)
+            ON CONFLICT(platform, handle) DO UPDATE SET
+                last_seen_id = COALESCE(excluded.last_seen_id, watermarks.last_seen_id),
+                last_seen_at = COALESCE(excluded.last_seen_at, watermarks.last_seen_at),
+                checked_at = excluded.checked_at
+            WHERE excluded.last_seen_at IS NULL
+                OR watermarks.last_seen_at IS NULL
+                OR excluded.last_seen_at >= watermarks.last_seen_at
+        """, [
+            (platform, handle, newest[0] if newest else None, newest[1] if newest else None, now)
+            for handle, newest in newest_by_handle.items()
+        ])
+
+def save_posts(posts_by_username):
+    """
+    Upsert fetched Instagram posts ({username: [post, ...]}) and advance each username's watermark.
+    Posts without a usable timestamp are dated by the time they were first fetched.
+    """
+    rows, newest_by_handle = [], {}
+    fetched_at = datetime.now(tz.tzutc()).isoformat(timespec="seconds")
+    undated = 0
+    for username, posts in posts_by_username.items():
+        items = []
+        for post in posts:
+            published_at = to_utc_iso(post.get("timestamp"))
+            if published_at is None:
+                # Dated by first fetch so it stays in the window; the upsert never moves published_at later
+                published_at = fetched_at
+                undated += 1
+            rows.append((post["id"], username, post.get("caption"), None, None, post.get("likes"), None, None, None, published_at))
+            items.append((post["id"], published_at))
+        newest_by_handle[username] = _newest(items)
+    if undated:
+        print(f"Stored {undated} Instagram posts without a timestamp as published at {fetched_at}")
+    _save("instagram", rows, newest_by_handle)
+
+def save_videos(videos_by_handle):
+    """
+    Upsert fetched YouTube videos ({handle: [Video, ...]}) and advance each handle's watermark.
+    """
+    rows, newest_by_handle = [], {}
+    for handle, videos in videos_by_handle.items():
+        items = []
+        for video in videos:
+            published_at = to_utc_iso(video.published_at)
+            rows.append((video.video_id, handle, None, video.title, video.description, video.like_count,
+                         video.view_count, video.comment_count, video.duration, published_at))
+            items.append((video.video_id, published_at))
+        newest_by_handle[handle] = _newest(items)
+    _save("youtube", rows, newest_by_handle)
+
+def _load_window(platform, handles, hours, previous=False):
+    if not handles:
+        return []
+    placeholders = ",".join("?" for _ in handles)
+    hours = hours or summary_window_hours
+    bounds, params = "published_at >= ?", [window_start(hours)]
+    if previous:
+        # Same length as the summary window, ending where it starts
+        bounds, params = "published_at >= ? AND published_at < ?", [window_start(2 * hours), window_start(hours)]
+    cursor = db.connect(db.COMPETITORS).execute(f"""
+        SELECT * FROM content
+        WHERE platform = ? AND handle IN ({placeholders}) AND {bounds}
+        ORDER BY handle, published_at DESC
+    """, (platform, *handles, *params))
+    columns = [column[0] for column in cursor.description]
+    rows = [dict(zip(columns, row)) for row in cursor.fetchall()]
+    order = {handle: i for i, handle in enumerate(handles)}
+    return sorted(rows, key=lambda row: order[row["handle"]])  # Keep the caller's handle order
+
+def load_posts(usernames, hours=None, previous=False):
+    """
+    Return the stored Instagram posts inside the summary window, or the window
+    before it with previous=True, grouped in username order.
+    """
+    return [
+        {"id": row["item_id"], "username": row["handle"], "caption": row["caption"] or "No caption",
+         "likes": row["likes"] or 0, "timestamp": row["published_at"]}
+        for row in _load_window("instagram", usernames, hours, previous)
+    ]
+
+def load_videos(handles, hours=None, previous=False):
+    """
+    Return {handle: [Video, ...]} for the stored YouTube videos inside the
+    summary window, or the window before it with previous=True.
+    """
+    videos = {}
+    for row in _load_window("youtube", handles, hours, previous):
+        videos.setdefault(row["handle"], []).append(Video(
+            video_id=row["item_id"],
+            handle=row["handle"],
+            title=row["title"] or "",
+            description=row["description"] or "No description available",
+            published_at=row["published_at"],
+            duration=row["duration"],
+            view_count=row["views"],
+            like_count=row["likes"],
+            comment_count=row["comments"]
+        ))
+    return videos
@@ -1,5 +1,6 @@
 import streamlit as st
 import sqlite3
+import db
 
 def dashboard():
 
@@ -13,24 +14,19 @@ def dashboard():
         st.error("You must be logged in to view this page.")
         return
 
-    #DB connection
-    with sqlite3.connect("users.db", check_same_thread=False) as conn:
-        cursor = conn.cursor()
+    # Fetch user data
+    try:
+        user_data = db.query_one(db.USERS, "SELECT youtube_id, instagram_id, email FROM users WHERE username=?", (username,))
 
-        # Fetch user data
-        try:
-            cursor.execute("SELECT youtube_id, instagram_id, email FROM users WHERE username=?", (username,))
-            user_data = cursor.fetchone()
-
-            if not user_data:
-                st.warning("No user data found.")
-                return
-            
-            youtube_id, instagram_id, email = user_data
-
-        except sqlite3.Error as e:
-            st.error(f"Database error: {e}")
+        if not user_data:
+            st.warning("No user data found.")
             return
+        
+        youtube_id, instagram_id, email = user_data
+
+    except sqlite3.Error as e:
+        st.error(f"Database error: {e}")
+        return
     
     # Display user data
     st.title("Your Social Media Profiles")
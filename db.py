@@ -0,0 +1,223 @@
+import os
+import sqlite3
+import threading
+from contextlib import contextmanager
+from dotenv import load_dotenv
+import metrics
+
+# Load environment variables
+load_dotenv()
+DATABASE_PATHS = {
+    "users": os.getenv("users_db_path", "users.db"),
+    "competitors": os.getenv("competitors_db_path", "competitors.db"),
+}
+busy_timeout_ms = int(os.getenv("db_busy_timeout_ms", "5000"))
+
+USERS = "users"
+COMPETITORS = "competitors"
+
+def _add_columns(table, columns):
+    # ALTER TABLE has no IF NOT EXISTS, so check the existing columns first
+    def migrate(conn):
+        existing = {row[1] for row in conn.execute(f"PRAGMA table_info({table})")}
+        for column, definition in columns:
+            if column not in existing:
+                conn.execute(f"ALTER TABLE {table} ADD COLUMN {column} {definition}")
+    return migrate
+
+# Each database has an ordered list of migrations; PRAGMA user_version records how many have run.
+# Version 1 uses IF NOT EXISTS throughout so it adopts databases created before this module existed.
+MIGRATIONS = {
+    USERS: [
+        [
+            """CREATE TABLE IF NOT EXISTS users (
+                username TEXT PRIMARY KEY,
+                password TEXT,
+                youtube_id TEXT,
+                instagram_id TEXT,
+                email TEXT NOT NULL,
+                summary_date TEXT
+            )""",
+            _add_columns("users", [
+                ("lease_owner", "TEXT"),
+                ("lease_expires_at", "REAL"),
+                ("attempts", "INTEGER NOT NULL DEFAULT 0"),
+            ]),
+            "CREATE INDEX IF NOT EXISTS idx_users_summary_date ON users (summary_date)",
+            """CREATE TABLE IF NOT EXISTS outbox (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                recipient TEXT NOT NULL,
+                subject TEXT NOT NULL,
+                body TEXT NOT NULL,
+                subtype TEXT NOT NULL DEFAULT 'html',
+                status TEXT NOT NULL DEFAULT 'pending',
+                attempts INTEGER NOT NULL DEFAULT 0,
+                next_attempt_at REAL NOT NULL,
+                claimed_at REAL,
+                last_error TEXT,
+                created_at REAL NOT NULL,
+                sent_at REAL
+            )""",
+            "CREATE INDEX IF NOT EXISTS idx_outbox_due ON outbox (status, next_attempt_at)",
+        ],
+        [
+            """CREATE TABLE IF NOT EXISTS access_tokens (
+                name TEXT PRIMARY KEY,
+                token TEXT NOT NULL,
+                expires_at REAL,
+                refreshed_at REAL NOT NULL
+            )""",
+        ],
+    ],
+    COMPETITORS: [
+        [
+            """CREATE TABLE IF NOT EXISTS competitors (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                user_id TEXT NOT NULL,
+                username TEXT,
+                youtube TEXT,
+                instagram TEXT,
+                verified BOOLEAN DEFAULT FALSE
+            )""",
+            "CREATE INDEX IF NOT EXISTS idx_competitors_user_id ON competitors (user_id)",
+            "DROP TABLE IF EXISTS users",  # Unused copy; accounts live in users.db
+            """CREATE TABLE IF NOT EXISTS youtube_channels (
+                handle TEXT PRIMARY KEY,
+                channel_id TEXT NOT NULL,
+                uploads_playlist_id TEXT NOT NULL,
+                resolved_at REAL NOT NULL
+            )""",
+            """CREATE TABLE IF NOT EXISTS content (
+                platform TEXT NOT NULL,
+                item_id TEXT NOT NULL,
+                handle TEXT NOT NULL,
+                caption TEXT,
+                title TEXT,
+                description TEXT,
+                likes INTEGER,
+                views INTEGER,
+                comments INTEGER,
+                duration TEXT,
+                published_at TEXT,
+                fetched_at REAL NOT NULL,
+                PRIMARY KEY (platform, item_id)
+            )""",
+            "CREATE INDEX IF NOT EXISTS idx_content_window ON content (platform, handle, published_at)",
+            """CREATE TABLE IF NOT EXISTS watermarks (
+                platform TEXT NOT NULL,
+                handle TEXT NOT NULL,
+                last_seen_id TEXT,
+                last_seen_at TEXT,
+                checked_at REAL NOT NULL,
+                PRIMARY KEY (platform, handle)
+            )""",
+            """CREATE TABLE IF NOT EXISTS llm_cache (
+                key TEXT PRIMARY KEY,
+                model_name TEXT NOT NULL,
+                response TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                last_used_at REAL NOT NULL
+            )""",
+            "CREATE INDEX IF NOT EXISTS idx_llm_cache_last_used ON llm_cache (last_used_at)",
+        ],
+        [
+            """CREATE TABLE IF NOT EXISTS verifications (
+                platform TEXT NOT NULL,
+                handle TEXT NOT NULL,
+                valid BOOLEAN NOT NULL,
+                checked_at REAL NOT NULL,
+                PRIMARY KEY (platform, handle)
+            )""",
+        ],
+        [
+            """CREATE TABLE IF NOT EXISTS youtube_quota (
+                day TEXT NOT NULL,
+                user TEXT NOT NULL,
+                handle TEXT NOT NULL,
+                method TEXT NOT NULL,
+                units INTEGER NOT NULL,
+                calls INTEGER NOT NULL,
+                PRIMARY KEY (day, user, handle, method)
+            )""",
+        ],
+    ],
+}
+
+_local = threading.local()
+_migrated = set()
+_migrate_lock = threading.Lock()
+
+def _open(name):
+    conn = sqlite3.connect(DATABASE_PATHS[name], check_same_thread=False, isolation_level=None,
+                           timeout=busy_timeout_ms / 1000, cached_statements=256)
+    conn.execute("PRAGMA journal_mode=WAL")  # Readers no longer block the writer
+    conn.execute("PRAGMA synchronous=NORMAL")  # Safe with WAL; skips an fsync per commit
+    conn.execute(f"PRAGMA busy_timeout={busy_timeout_ms}")
+    return conn
+
+def migrate(name, conn=None):
+    """
+    Bring a database up to the latest schema version.
+    """
+    conn = conn or _open(name)
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        version = conn.execute("PRAGMA user_version").fetchone()[0]
+        for number, steps in enumerate(MIGRATIONS[name][version:], start=version + 1):
+            for step in steps:
+                step(conn) if callable(step) else conn.execute(step)
+            conn.execute(f"PRAGMA user_version={number}")
+        conn.execute("COMMIT")
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
+
+def connect(name):
+    """
+    Return this thread's connection to a database, opening it and applying
+    migrations on first use. Connections run in autocommit mode; use
+    transaction() to group writes.
+    """
+    connections = getattr(_local, "connections", None)
+    if connections is None:
+        connections = _local.connections = {}
+    conn = connections.get(name)
+    if conn is None:
+        conn = connections[name] = _open(name)
+        if name not in _migrated:
+            with _migrate_lock:
+                if name not in _migrated:
+                    migrate(name, conn)
+                    _migrated.add(name)
+    return conn
+
+@contextmanager
+def transaction(name, immediate=False):
+    """
+    Run a block in one transaction on this thread's connection. Use immediate=True
+    when the block reads and then writes, so the write lock is taken up front.
+    """
+    conn = connect(name)
+    with metrics.span("sqlite.transaction", log=False, database=name):
+        conn.execute("BEGIN IMMEDIATE" if immediate else "BEGIN")
+        try:
+            yield conn
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
+
+def query(name, sql, params=()):
+    with metrics.span("sqlite.query", log=False, database=name):
+        return connect(name).execute(sql, params).fetchall()
+
+def query_one(name, sql, params=()):
+    with metrics.span("sqlite.query", log=False, database=name):
+        return connect(name).execute(sql, params).fetchone()
+
+def execute(name, sql, params=()):
+    """
+    Run one write statement in its own transaction and return the cursor.
+    """
+    with metrics.span("sqlite.execute", log=False, database=name):
+        return connect(name).execute(sql, params)
@@ -0,0 +1,128 @@
+import os
+from dataclasses import dataclass
+from datetime import datetime, timezone
+import numpy as np
+from dotenv import load_dotenv
+
+# Load environment variables
+load_dotenv()
+brief_top_k = int(os.getenv("brief_top_k", "25"))  # posts or videos per platform sent to Gemini; 0 sends everything
+
+MIN_BASELINE = 1.0  # Keeps accounts with a zero median from dividing by zero
+MIN_AGE_HOURS = 1.0  # Items published minutes ago would otherwise get an absurd pace
+
+@dataclass
+class Score:
+    score: float
+    relative: float  # engagement over the account's median
+    velocity: float  # engagement per hour since publish, over the account's median pace
+
+    def describe(self):
+        return f"Engagement: {self.relative:.1f}x account median, {self.velocity:.1f}x usual pace"
+
+def _timestamp(value):
+    try:
+        return datetime.fromisoformat(value).timestamp()
+    except (TypeError, ValueError):
+        return np.nan
+
+def _group_median(values, groups, group_count):
+    # Sort by (group, value) once, then read each group's middle element(s); NaN values are ignored
+    known = ~np.isnan(values)
+    values, groups = values[known], groups[known]
+    order = np.lexsort((values, groups))
+    values = values[order]
+    counts = np.bincount(groups, minlength=group_count)
+    starts = np.concatenate(([0], np.cumsum(counts)[:-1]))
+    medians = np.full(group_count, np.nan)
+    present = counts > 0
+    low = starts[present] + (counts[present] - 1) // 2
+    high = starts[present] + counts[present] // 2
+    medians[present] = (values[low] + values[high]) / 2
+    return medians
+
+class EngagementTable:
+    """
+    Column arrays for one run's posts or videos: account, engagement and
+    publish time. Scores for every row are computed at once against each
+    account's own median, so small accounts compete with large ones on
+    how far a post beats their usual numbers rather than on raw reach.
+    """
+
+    def __init__(self, handles, engagement, published_at, now=None):
+        self.size = len(handles)
+        self.accounts, self.account = np.unique(np.asarray(handles, dtype=str), return_inverse=True)
+        self.engagement = np.asarray(engagement, dtype=float).reshape(self.size)
+        published = np.array([_timestamp(value) for value in published_at], dtype=float).reshape(self.size)
+        now = (now or datetime.now(timezone.utc)).timestamp()
+        self.age_hours = np.maximum((now - published) / 3600, MIN_AGE_HOURS)
+
+    def scores(self):
+        """
+        Return (score, relative, velocity) arrays. Score is the geometric mean
+        of engagement and pace relative to the account's medians; rows with
+        no engagement figure score NaN.
+        """
+        if not self.size:
+            return np.empty(0), np.empty(0), np.empty(0)
+        group_count = len(self.accounts)
+        pace = self.engagement / self.age_hours
+        baseline = np.maximum(_group_median(self.engagement, self.account, group_count), MIN_BASELINE)
+        baseline_pace = np.maximum(_group_median(pace, self.account, group_count), MIN_BASELINE / 24)
+        relative = self.engagement / baseline[self.account]
+        velocity = pace / baseline_pace[self.account]
+        velocity = np.where(np.isnan(velocity), relative, velocity)  # Unknown publish time: rank on engagement alone
+        return np.sqrt(relative * velocity), relative, velocity
+
+    def top_k(self, k):
+        """
+        Return row indexes of the k highest scores, best first. Each account's
+        best row is kept before filling the rest by score, so no competitor
+        drops out of the brief while there is room for it.
+        """
+        score = self.scores()[0]
+        order = np.argsort(-np.nan_to_num(score, nan=-np.inf), kind="stable")
+        if not k or k >= self.size:
+            return order
+        _, first_positions = np.unique(self.account[order], return_index=True)
+        chosen = np.zeros(self.size, dtype=bool)
+        chosen[order[np.sort(first_positions)[:k]]] = True
+        remaining = k - chosen.sum()
+        if remaining > 0:
+            chosen[order[~chosen[order]][:remaining]] = True
+        return order[chosen[order]]
+
+def _score(arrays, index):
+    # Rounded so the prompt, and with it the LLM cache key, only changes when the ranking meaningfully does
+    score, relative, velocity = (float(values[index]) for values in arrays)
+    if np.isnan(score):
+        return None
+    return Score(round(score, 1), round(relative, 1), round(velocity, 1))
+
+def select_posts(posts, k=None, now=None):
+    """
+    Keep the top-k Instagram posts by likes relative to their account, best
+    first, each with its Score (None without a like count) under "engagement".
+    """
+    table = EngagementTable([post.get("username") for post in posts], [post.get("likes") for post in posts],
+                            [post.get("timestamp") for post in posts], now)
+    arrays = table.scores()
+    return [dict(posts[i], engagement=_score(arrays, i)) for i in table.top_k(brief_top_k if k is None else k)]
+
+def select_videos(videos_by_handle, k=None, now=None):
+    """
+    Keep the top-k YouTube videos by views relative to their channel.
+    Returns ({handle: [Video, ...]} in the original handle order with each
+    channel's videos best first, {video_id: Score}).
+    """
+    rows = [(handle, video) for handle, handle_videos in videos_by_handle.items() for video in handle_videos]
+    table = EngagementTable([handle for handle, _ in rows], [video.view_count for _, video in rows],
+                            [video.published_at for _, video in rows], now)
+    arrays = table.scores()
+    selected = {handle: [] for handle in videos_by_handle}
+    scores = {}
+    for i in table.top_k(brief_top_k if k is None else k):
+        handle, video = rows[i]
+        selected[handle].append(video)
+        scores[video.video_id] = _score(arrays, i)
+    return {handle: handle_videos for handle, handle_videos in selected.items() if handle_videos}, scores
@@ -0,0 +1,101 @@
+import os
+import contextvars
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from dataclasses import dataclass
+from typing import Any, Optional
+from dotenv import load_dotenv
+from graph_client import BATCH_LIMIT
+from instagram_graph_api import get_posts_uploaded_instagram_batch
+from youtube_data_api import get_video_uploaded_youtube, enrich_videos
+import content_store
+import metrics
+
+# Load environment variables
+load_dotenv()
+fetch_max_workers = int(os.getenv("fetch_max_workers", "8"))
+
+@dataclass
+class FetchResult:
+    platform: str
+    handle: str
+    data: Any = None
+    error: Optional[Exception] = None
+
+def _fetch_youtube(handle, since, last_seen_id):
+    try:
+        with metrics.span("fetch.youtube", platform="youtube", handle=handle) as fields:
+            videos = get_video_uploaded_youtube(handle, since=since, last_seen_id=last_seen_id)
+            fields["items"] = len(videos)
+        return FetchResult("youtube", handle, data=videos)
+    except Exception as e:
+        return FetchResult("youtube", handle, error=e)
+
+def _fetch_instagram_batch(usernames, since, last_seen_ids):
+    try:
+        with metrics.span("fetch.instagram", platform="instagram", handles=len(usernames)):
+            results = get_posts_uploaded_instagram_batch(usernames, since=since, last_seen_ids=last_seen_ids)
+    except Exception as e:
+        return [FetchResult("instagram", username, error=e) for username in usernames]
+    fetched = []
+    for username in usernames:
+        posts, error = results.get(username, ([], "No response for username"))
+        fetched.append(FetchResult("instagram", username, data=posts, error=RuntimeError(error) if error else None))
+    return fetched
+
+def fetch_competitor_content(instagram_usernames, youtube_handles, max_workers=None, window_hours=None, progress=None):
+    """
+    Fetch new Instagram posts and YouTube videos for every handle at once and
+    store them in the local content store. Each handle is paged only until
+    its watermark or the start of the summary window is reached, then the
+    statistics of every stored video in the window are refreshed in batches.
+    Instagram usernames go out as Graph API batch requests of up to 50,
+    YouTube handles as one job each, all on the same bounded thread pool.
+    Returns (instagram_results, youtube_results), each a list of FetchResult
+    in the same order as the handles passed in. Errors are captured per handle
+    so the caller can report them from the Streamlit thread. With progress,
+    progress(result) is called from the calling thread as each handle finishes.
+    """
+    instagram_usernames = [u for u in instagram_usernames if u]
+    youtube_handles = [h for h in youtube_handles if h]
+    instagram_batches = [instagram_usernames[i:i + BATCH_LIMIT] for i in range(0, len(instagram_usernames), BATCH_LIMIT)]
+    jobs = len(instagram_batches) + len(youtube_handles)
+    if not jobs:
+        return [], []
+
+    since = content_store.window_start(window_hours)
+    instagram_seen = content_store.get_watermarks("instagram", instagram_usernames)
+    youtube_seen = content_store.get_watermarks("youtube", youtube_handles)
+
+    workers = max(1, min(max_workers or fetch_max_workers, jobs))
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="fetch") as executor:
+        # Jobs run in a copy of the caller's context so quota and timings stay attributed to its user and priority
+        instagram_futures = [executor.submit(contextvars.copy_context().run, _fetch_instagram_batch, batch, since, instagram_seen)
+                             for batch in instagram_batches]
+        youtube_futures = [executor.submit(contextvars.copy_context().run, _fetch_youtube, handle, since, youtube_seen.get(handle))
+                           for handle in youtube_handles]
+        if progress:
+            for future in as_completed(instagram_futures + youtube_futures):
+                finished = future.result()
+                for result in finished if isinstance(finished, list) else [finished]:
+                    progress(result)
+        instagram_results = [result for future in instagram_futures for result in future.result()]
+        youtube_results = [future.result() for future in youtube_futures]
+
+    for result in instagram_results + youtube_results:
+        if result.error:
+            metrics.increment("failures", stage=f"fetch.{result.platform}")
+
+    # Persist from the calling thread so all writes land in one transaction per platform
+    with metrics.span("fetch.store"):
+        content_store.save_posts({r.handle: r.data for r in instagram_results if not r.error})
+        content_store.save_videos({r.handle: r.data for r in youtube_results if not r.error})
+
+    # Refresh statistics for every video in the window, one videos().list per 50 videos
+    videos_by_handle = content_store.load_videos(youtube_handles, window_hours)
+    if videos_by_handle:
+        with metrics.span("fetch.enrich", platform="youtube") as fields:
+            videos = [video for videos in videos_by_handle.values() for video in videos]
+            fields["items"] = len(videos)
+            enrich_videos(videos)
+            content_store.save_videos(videos_by_handle)
+    return instagram_results, youtube_results
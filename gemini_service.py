@@ -0,0 +1,148 @@
+import os
+import json
+import asyncio
+import threading
+import time
+import contextvars
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from dotenv import load_dotenv
+from llm_cache import llm_cache
+import metrics
+
+# Load environment variables
+load_dotenv()
+gemini_max_concurrency = int(os.getenv("gemini_max_concurrency", "4"))
+gemini_requests_per_minute = int(os.getenv("gemini_requests_per_minute", "15"))
+gemini_api_key = os.getenv("gemini_api_key")
+
+@dataclass
+class GeminiRequest:
+    model_name: str
+    system_instruction: str
+    prompt: object
+    generation_config: dict = field(default_factory=dict)
+
+class GeminiService:
+    """
+    Process-wide Gemini client. Reuses configured GenerativeModel instances,
+    answers repeated prompts from the LLM cache and keeps every caller, across
+    threads and event loops, under a concurrency cap and a requests-per-minute limit.
+    """
+
+    def __init__(self, max_concurrency=gemini_max_concurrency, requests_per_minute=gemini_requests_per_minute):
+        self.requests_per_minute = requests_per_minute
+        self.slots = threading.BoundedSemaphore(max_concurrency)
+        self.sent = deque()  # Send times inside the last minute
+        self.rate_lock = threading.Lock()
+        self.models = {}
+        self.models_lock = threading.Lock()
+        self.genai = None
+        # Not the event loop's default executor: asyncio.run waits for that one, so a timed out call would still block
+        self.executor = ThreadPoolExecutor(thread_name_prefix="gemini")
+
+    def _client(self):
+        # google.generativeai takes about a second to import, so it is loaded and configured on first use
+        if self.genai is None:
+            import google.generativeai as genai
+            genai.configure(api_key=gemini_api_key)
+            self.genai = genai
+        return self.genai
+
+    def model(self, request):
+        key = (request.model_name, request.system_instruction, json.dumps(request.generation_config, sort_keys=True))
+        with self.models_lock:
+            if key not in self.models:
+                self.models[key] = self._client().GenerativeModel(
+                    model_name=request.model_name,
+                    generation_config=request.generation_config,
+                    system_instruction=request.system_instruction
+                )
+            return self.models[key]
+
+    def _wait_for_rate(self):
+        while True:
+            with self.rate_lock:
+                now = time.monotonic()
+                while self.sent and now - self.sent[0] >= 60:
+                    self.sent.popleft()
+                if len(self.sent) < self.requests_per_minute:
+                    self.sent.append(now)
+                    return
+                wait = 60 - (now - self.sent[0])
+            time.sleep(wait)
+
+    def _call(self, request):
+        with self.slots:
+            self._wait_for_rate()
+            metrics.increment("api_calls", service="gemini")
+            with metrics.span("gemini.generate", model=request.model_name):
+                return self.model(request).generate_content(request.prompt)
+
+    def generate_sync(self, request):
+        """
+        Generate a response for one request, blocking the calling thread.
+        """
+        return llm_cache.get_or_generate(
+            request.model_name, request.system_instruction, request.generation_config, request.prompt,
+            lambda: self._call(request)
+        )
+
+    def stream(self, request):
+        """
+        Yield the response text for one request chunk by chunk as Gemini produces it.
+        A cached response is yielded whole; a streamed one is cached once complete and valid.
+        """
+        key = llm_cache.key(request.model_name, request.system_instruction, request.generation_config, request.prompt)
+        cached = llm_cache.get(key)
+        if cached is not None:
+            yield cached
+            return
+        chunks = []
+        with self.slots:
+            self._wait_for_rate()
+            metrics.increment("api_calls", service="gemini")
+            with metrics.span("gemini.stream", model=request.model_name):
+                for chunk in self.model(request).generate_content(request.prompt, stream=True):
+                    text = chunk.text
+                    chunks.append(text)
+                    yield text
+        text = "".join(chunks)
+        if llm_cache.cacheable(request.generation_config, text):
+            llm_cache.put(key, request.model_name, text)
+
+    async def generate(self, request, timeout=None):
+        """
+        Generate a response for one request without blocking the event loop.
+        With a timeout, asyncio.TimeoutError is raised once it passes; the call
+        itself still completes in the background and its response is cached.
+        """
+        call = asyncio.get_running_loop().run_in_executor(self.executor, contextvars.copy_context().run, self.generate_sync, request)
+        return await asyncio.wait_for(call, timeout)
+
+    async def _generate_all(self, requests, timeout=None):
+        return await asyncio.gather(*(self.generate(request, timeout) for request in requests), return_exceptions=True)
+
+    def generate_batch(self, requests, timeout=None):
+        """
+        Run several requests in parallel and return their responses in order.
+        A request that is None, fails or takes longer than timeout seconds
+        yields None, matching the single-call helpers.
+        """
+        pending = [request for request in requests if request is not None]
+        generated = iter(asyncio.run(self._generate_all(pending, timeout)) if pending else [])
+        responses = [next(generated) if request is not None else None for request in requests]
+        results = []
+        for response in responses:
+            if isinstance(response, asyncio.TimeoutError):
+                print(f"Gemini response took longer than {timeout} seconds")
+                results.append(None)
+            elif isinstance(response, Exception):
+                print(f"Error generating Gemini response: {str(response)}")
+                results.append(None)
+            else:
+                results.append(response)
+        return results
+
+gemini_service = GeminiService()
@@ -0,0 +1,98 @@
+import os
+import json
+import random
+import time
+import requests
+from requests.adapters import HTTPAdapter
+from dotenv import load_dotenv
+import metrics
+
+# Load environment variables
+load_dotenv()
+graph_api_url = os.getenv("graph_api_url", "https://graph.facebook.com/v17.0")
+graph_timeout = float(os.getenv("graph_timeout", "10"))  # seconds, per request
+graph_max_retries = int(os.getenv("graph_max_retries", "3"))
+
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+BATCH_LIMIT = 50  # Graph API accepts at most 50 sub-requests per batch
+
+class GraphClient:
+    """
+    Shared Graph API client. Keeps one pooled keep-alive session, applies a
+    timeout to every request and retries 429/5xx and connection errors with
+    jittered exponential backoff.
+    """
+
+    def __init__(self, base_url=graph_api_url, timeout=graph_timeout, max_retries=graph_max_retries,
+                 backoff_base=0.5, backoff_max=8.0, pool_size=20):
+        self.base_url = base_url.rstrip("/")
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
+    def _backoff(self, attempt, response=None):
+        retry_after = response.headers.get("Retry-After") if response is not None else None
+        if retry_after and retry_after.isdigit():
+            return min(float(retry_after), self.backoff_max)
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt))  # Full jitter
+
+    def request(self, method, path, **kwargs):
+        """
+        Send a request relative to the Graph API base URL and return the decoded JSON.
+        Raises requests.exceptions.RequestException once retries are exhausted.
+        """
+        url = f"{self.base_url}/{path.lstrip('/')}"
+        with metrics.span("graph.request", platform="instagram", path=path or "batch"):
+            for attempt in range(self.max_retries + 1):
+                response = None
+                metrics.increment("api_calls", service="graph")
+                try:
+                    response = self.session.request(method, url, timeout=self.timeout, **kwargs)
+                except (requests.exceptions.ConnectionError, requests.exceptions.Timeout):
+                    if attempt == self.max_retries:
+                        raise
+                else:
+                    if response.status_code not in RETRY_STATUSES or attempt == self.max_retries:
+                        response.raise_for_status()
+                        return response.json()
+                metrics.increment("retries", service="graph")
+                time.sleep(self._backoff(attempt, response))
+
+    def get(self, path, params=None):
+        return self.request("GET", path, params=params)
+
+    def post(self, path, data=None):
+        return self.request("POST", path, data=data)
+
+    def batch(self, relative_urls, access_token):
+        """
+        Send GET sub-requests in batch POSTs of up to 50 each.
+        Returns one (body, error) tuple per relative URL, in the same order.
+        """
+        results = []
+        for start in range(0, len(relative_urls), BATCH_LIMIT):
+            chunk = relative_urls[start:start + BATCH_LIMIT]
+            responses = self.post("", data={
+                "access_token": access_token,
+                "batch": json.dumps([{"method": "GET", "relative_url": url} for url in chunk])
+            })
+            for response in responses:
+                if response is None:  # Sub-request timed out on Facebook's side
+                    results.append((None, "Batch sub-request did not complete"))
+                    continue
+                try:
+                    body = json.loads(response.get("body") or "{}")
+                except json.JSONDecodeError:
+                    body = {}
+                if response.get("code") != 200 or "error" in body:
+                    results.append((None, body.get("error", {}).get("message", f"HTTP {response.get('code')}")))
+                else:
+                    results.append((body, None))
+        return results
+
+graph = GraphClient()
@@ -1,4 +1,5 @@
 import streamlit as st
+from admin import is_admin
 
 def home():
     username = st.session_state.get("username") # Get username from session state
@@ -20,6 +21,10 @@ def home():
             st.session_state["page"] = "trend_analysis"
             st.rerun()
 
+    if is_admin(username) and st.button("Performance", key="home_admin"):
+        st.session_state["page"] = "admin"
+        st.rerun()
+
     if st.button("Logout", key="home_logout"):
         st.session_state["logged_in"] = False
         st.session_state["username"] = None
@@ -1,75 +1,54 @@
 import os
 import requests
+from urllib.parse import urlencode
+from graph_client import graph
+from token_manager import token_manager
 from datetime import datetime, timedelta
 from dateutil import parser, tz
 from dotenv import load_dotenv
 import json
-import google.generativeai as genai
 from pydantic import BaseModel
+from gemini_service import GeminiRequest, gemini_service
 
 # Load environment variables
 load_dotenv()
 ig_user_id = os.getenv("ig_user_id")
-long_access_token = os.getenv("long_access_token")
-
-# Configure Gemini API
-try:
-    genai.configure(api_key=os.getenv("gemini_api_key"))
-except Exception as e:
-    print(f"Error configuring Gemini API: {str(e)}")
-    exit(1)
 
 # Define Pydantic model for response
 class Response(BaseModel):
     instagram_trend: str
     instagram_recommend: str
 
+MEDIA_LIMIT = 10
+MEDIA_SUBFIELDS = "{id,caption,timestamp,like_count}"
+MEDIA_FIELDS = f"{{media.limit({MEDIA_LIMIT}){MEDIA_SUBFIELDS}}}"  # Only the posts we summarize
+MAX_MEDIA_PAGES = 5
+
 def get_post_uploaded_instagram(ig_username):
     """
     Fetch the 10 most recent Instagram posts for a given username.
     Returns a list of dictionaries with caption, likes, and timestamp.
     """
-    if not ig_user_id or not long_access_token:
+    access_token = token_manager.current()
+    if not ig_user_id or not access_token:
         print("Error: Instagram user ID or access token not set in .env file")
         return []
 
-    required_parameter = "{media{caption,timestamp,like_count}}"
-    url = (
-        f"https://graph.facebook.com/v17.0/{ig_user_id}"
-        f"?fields=business_discovery.username({ig_username}){required_parameter}"
-        f"&access_token={long_access_token}"
-    )
-
     try:
-        response = requests.get(url)
-        response.raise_for_status()
-        metadata = response.json()
+        metadata = graph.get(ig_user_id, params={
+            "fields": f"business_discovery.username({ig_username}){MEDIA_FIELDS}",
+            "access_token": access_token
+        })
 
         # Check for API errors
         if "error" in metadata:
             print(f"Instagram API error: {metadata['error']['message']}")
             return []
 
-        # Safely access media data
-        media_data = metadata.get("business_discovery", {}).get("media", {}).get("data", [])
+        media_data = _parse_media(metadata)
         if not media_data:
             print(f"No posts found for Instagram username: {ig_username}")
-            return []
-
-        # Take the 10 most recent posts
-        caption_dict = []
-        for media_item in media_data[:10]:  # Limit to first 10 posts
-            try:
-                caption_dict.append({
-                    "caption": media_item.get("caption", "No caption"),
-                    "likes": media_item.get("like_count", 0),
-                    "timestamp": media_item.get("timestamp", "No timestamp")
-                })
-            except Exception as e:
-                print(f"Error processing post: {str(e)}")
-                continue
-
-        return caption_dict
+        return media_data
 
     except requests.exceptions.RequestException as e:
         print(f"Error fetching Instagram posts for {ig_username}: {str(e)}")
@@ -78,28 +57,148 @@ def get_post_uploaded_instagram(ig_username):
         print(f"Unexpected error in get_post_uploaded_instagram: {str(e)}")
         return []
 
+def _parse_media(metadata):
+    # Safely access media data and take the 10 most recent posts
+    media_data = metadata.get("business_discovery", {}).get("media", {}).get("data", [])
+    caption_dict = []
+    for media_item in media_data[:MEDIA_LIMIT]:  # Limit to first 10 posts
+        try:
+            caption_dict.append({
+                "id": media_item.get("id"),
+                "caption": media_item.get("caption", "No caption"),
+                "likes": media_item.get("like_count", 0),
+                "timestamp": media_item.get("timestamp", "No timestamp")
+            })
+        except Exception as e:
+            print(f"Error processing post: {str(e)}")
+            continue
+    return caption_dict
+
+def _next_cursor(metadata):
+    media = metadata.get("business_discovery", {}).get("media", {})
+    if not media.get("paging", {}).get("next"):
+        return None
+    return media.get("paging", {}).get("cursors", {}).get("after")
+
+def _take_window(posts, since, last_seen_id):
+    # Keep posts until the first one outside the window or the last one seen before
+    kept, reached, undated = [], False, 0
+    for post in posts:
+        try:
+            if since and parser.isoparse(post["timestamp"]) < parser.isoparse(since):
+                reached = True
+                break
+        except (TypeError, ValueError):
+            undated += 1  # Kept as newest; the content store dates it by when it was first fetched
+        kept.append(post)  # Seen posts in the window are kept so their likes stay fresh
+        if last_seen_id and post.get("id") == last_seen_id:
+            reached = True
+            break
+    if undated:
+        print(f"Kept {undated} Instagram posts without a timestamp")
+    return kept, reached
+
+def get_posts_uploaded_instagram_batch(ig_usernames, since=None, last_seen_ids=None):
+    """
+    Fetch recent posts for many usernames with Graph API batch requests,
+    50 usernames per round-trip. Without since, returns the 10 most recent
+    posts per username. With since (a UTC ISO timestamp), only posts in the
+    window are returned, and usernames whose first page is entirely new are
+    paged further until a seen or out-of-window post is reached. Every page
+    depth is one more round of batch requests, so the number of calls stays
+    near ceil(usernames / 50) per page.
+    Returns a dict mapping each username to a (posts, error) tuple, where
+    error is None on success.
+    """
+    access_token = token_manager.current()
+    if not ig_user_id or not access_token:
+        return {username: ([], "Instagram user ID or access token not set in .env file") for username in ig_usernames}
+    last_seen_ids = last_seen_ids or {}
+
+    relative_urls = [
+        f"{ig_user_id}?" + urlencode({"fields": f"business_discovery.username({username}){MEDIA_FIELDS}"})
+        for username in ig_usernames
+    ]
+    try:
+        responses = graph.batch(relative_urls, access_token)
+    except requests.exceptions.RequestException as e:
+        return {username: ([], str(e)) for username in ig_usernames}
+
+    results = {}
+    cursors = {}  # username -> cursor of the next page, for usernames still inside the window
+    for username, (body, error) in zip(ig_usernames, responses):
+        if error:
+            results[username] = ([], error)
+            continue
+        if not since:
+            results[username] = (_parse_media(body), None)
+            continue
+        posts, reached = _take_window(_parse_media(body), since, last_seen_ids.get(username))
+        results[username] = (posts, None)
+        cursor = _next_cursor(body)
+        if cursor and not reached:
+            cursors[username] = cursor
+
+    # Follow-up pages go out as batch requests too: one round per page depth for every username still paging
+    for _ in range(MAX_MEDIA_PAGES - 1):
+        if not cursors:
+            break
+        paging = list(cursors)
+        relative_urls = [
+            f"{ig_user_id}?" + urlencode({"fields": f"business_discovery.username({username}){{media.after({cursors[username]}).limit({MEDIA_LIMIT}){MEDIA_SUBFIELDS}}}"})
+            for username in paging
+        ]
+        try:
+            responses = graph.batch(relative_urls, access_token)
+        except requests.exceptions.RequestException as e:
+            print(f"Error paging Instagram posts for {len(paging)} usernames: {str(e)}")
+            break
+        cursors = {}
+        for username, (page, error) in zip(paging, responses):
+            if error:
+                print(f"Error paging Instagram posts for {username}: {error}")
+                continue
+            page_posts, reached = _take_window(_parse_media(page), since, last_seen_ids.get(username))
+            results[username][0].extend(page_posts)
+            cursor = _next_cursor(page)
+            if cursor and not reached:
+                cursors[username] = cursor
+    return results
+
+GEMINI_MODEL_NAME = "gemini-1.5-flash"
+GEMINI_GENERATION_CONFIG = {
+    "response_mime_type": "application/json",
+    "temperature": 0.5
+}
+GEMINI_SYSTEM_INSTRUCTION = (
+    "You are an AI agent designed to analyze social media data across multiple users. Based on the provided Instagram post captions and likes, "
+    "which are the top posts of each account ranked by engagement against that account's usual numbers, "
+    "analyze the trends and provide recommendations to succeed in the trend. Return a JSON response with 'instagram_trend' (string) and 'instagram_recommend' (string)."
+)
+
+def gemini_request_insta(insta_detail):
+    """
+    Build the Gemini request that analyzes Instagram posts, or None if there is nothing to analyze.
+    """
+    formatted_content = "\n".join([
+        f"Caption: {item['caption']}\nLikes: {item['likes']}" + (f"\n{item['engagement'].describe()}" if item.get("engagement") else "")
+        for item in insta_detail
+    ])
+    if not formatted_content:
+        print("No Instagram data to analyze")
+        return None
+    return GeminiRequest(GEMINI_MODEL_NAME, GEMINI_SYSTEM_INSTRUCTION, formatted_content, GEMINI_GENERATION_CONFIG)
+
 def gemini_model_insta(insta_detail):
     """
     Analyze Instagram posts and return trends and recommendations.
+    Identical inputs are answered from the LLM response cache.
     """
     try:
-        formatted_content = "\n".join([f"Caption: {item['caption']}\nLikes: {item['likes']}" for item in insta_detail])
-        if not formatted_content:
-            print("No Instagram data to analyze")
+        request = gemini_request_insta(insta_detail)
+        if not request:
             return None
-
-        model = genai.GenerativeModel(
-            model_name="gemini-1.5-flash",
-            generation_config={
-                "response_mime_type": "application/json",
-                "temperature": 0.5
-            },
-            system_instruction=(
-                "You are an AI agent designed to analyze social media data across multiple users. Based on the provided Instagram post captions and likes, "
-                "analyze the trends and provide recommendations to succeed in the trend. Return a JSON response with 'instagram_trend' (string) and 'instagram_recommend' (string)."
-            )
-        )
-        return model.generate_content(formatted_content)
+        return gemini_service.generate_sync(request)
     except Exception as e:
         print(f"Error in gemini_model_insta: {str(e)}")
         return None
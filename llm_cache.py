@@ -0,0 +1,150 @@
+import os
+import json
+import hashlib
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from dotenv import load_dotenv
+import db
+import metrics
+
+# Load environment variables
+load_dotenv()
+llm_cache_memory_entries = int(os.getenv("llm_cache_memory_entries", "128"))
+llm_cache_max_entries = int(os.getenv("llm_cache_max_entries", "2000"))
+llm_cache_max_age = int(os.getenv("llm_cache_max_age", str(7 * 24 * 3600)))  # seconds
+
+class CachedResponse:
+    """
+    Stand-in for a Gemini response served from the cache. Callers only read .text.
+    """
+
+    def __init__(self, text):
+        self.text = text
+
+class LLMCache:
+    """
+    Content-addressed cache for LLM responses. Keys are a SHA-256 of the model
+    name, system instruction, generation config and prompt. Lookups go through
+    an in-memory LRU first, then a SQLite table with size- and age-based eviction.
+    """
+
+    def __init__(self, memory_entries=llm_cache_memory_entries,
+                 max_entries=llm_cache_max_entries, max_age=llm_cache_max_age):
+        self.memory_entries = memory_entries
+        self.max_entries = max_entries
+        self.max_age = max_age
+        self.memory = OrderedDict()
+        self.lock = threading.Lock()
+        self.counters = {"memory_hits": 0, "disk_hits": 0, "misses": 0, "evictions": 0}
+
+    @staticmethod
+    def key(model_name, system_instruction, generation_config, prompt):
+        payload = json.dumps([model_name, system_instruction, generation_config, prompt], sort_keys=True, default=str)
+        return hashlib.sha256(payload.encode()).hexdigest()
+
+    def _remember(self, key, text, created_at):
+        with self.lock:
+            self.memory[key] = (text, created_at)
+            self.memory.move_to_end(key)
+            while len(self.memory) > self.memory_entries:
+                self.memory.popitem(last=False)
+
+    def get(self, key):
+        """
+        Return the cached response text for a key, or None on a miss.
+        """
+        now = time.time()
+        with self.lock:
+            entry = self.memory.get(key)
+            if entry and now - entry[1] <= self.max_age:
+                self.memory.move_to_end(key)
+                self.counters["memory_hits"] += 1
+                metrics.increment("cache_hits", cache="llm_memory")
+                return entry[0]
+            self.memory.pop(key, None)
+
+        try:
+            row = db.query_one(db.COMPETITORS, "SELECT response, created_at FROM llm_cache WHERE key = ? AND created_at >= ?",
+                               (key, now - self.max_age))
+            if row:
+                db.execute(db.COMPETITORS, "UPDATE llm_cache SET last_used_at = ? WHERE key = ?", (now, key))
+        except sqlite3.Error as e:
+            print(f"LLM cache error: {e}")
+            row = None
+
+        with self.lock:
+            self.counters["disk_hits" if row else "misses"] += 1
+        metrics.increment("cache_hits" if row else "cache_misses", cache="llm")
+        if not row:
+            return None
+        self._remember(key, row[0], row[1])
+        return row[0]
+
+    @staticmethod
+    def cacheable(generation_config, text):
+        """
+        Return True if a response text is worth caching. JSON responses must
+        parse, so one cut short by MAX_TOKENS or a dropped stream is not
+        served for every later brief of the same prompt.
+        """
+        if not text:
+            return False
+        if (generation_config or {}).get("response_mime_type") == "application/json":
+            try:
+                json.loads(text)
+            except ValueError:
+                metrics.increment("failures", stage="llm_cache.put")
+                return False
+        return True
+
+    def put(self, key, model_name, text):
+        now = time.time()
+        self._remember(key, text, now)
+        try:
+            with db.transaction(db.COMPETITORS) as conn:
+                cursor = conn.cursor()
+                cursor.execute("""
+                    INSERT OR REPLACE INTO llm_cache (key, model_name, response, created_at, last_used_at)
+                    VALUES (?, ?, ?, ?, ?)
+                """, (key, model_name, text, now, now))
+                self._evict(cursor, now)
+        except sqlite3.Error as e:
+            print(f"LLM cache error: {e}")
+
+    def _evict(self, cursor, now):
+        # Drop expired entries, then the least recently used beyond the size cap
+        cursor.execute("DELETE FROM llm_cache WHERE created_at < ?", (now - self.max_age,))
+        evicted = cursor.rowcount
+        cursor.execute("""
+            DELETE FROM llm_cache WHERE key IN (
+                SELECT key FROM llm_cache ORDER BY last_used_at DESC LIMIT -1 OFFSET ?
+            )
+        """, (self.max_entries,))
+        evicted += cursor.rowcount
+        with self.lock:
+            self.counters["evictions"] += evicted
+
+    def get_or_generate(self, model_name, system_instruction, generation_config, prompt, generate):
+        """
+        Return a cached response for the prompt, or call generate() and cache its text.
+        """
+        key = self.key(model_name, system_instruction, generation_config, prompt)
+        text = self.get(key)
+        if text is not None:
+            return CachedResponse(text)
+        response = generate()
+        if response is not None and self.cacheable(generation_config, getattr(response, "text", None)):
+            self.put(key, model_name, response.text)
+        return response
+
+    def stats(self):
+        with self.lock:
+            stats = dict(self.counters)
+            stats["memory_entries"] = len(self.memory)
+        lookups = stats["memory_hits"] + stats["disk_hits"] + stats["misses"]
+        stats["hit_rate"] = (stats["memory_hits"] + stats["disk_hits"]) / lookups if lookups else 0.0
+        return stats
+
+llm_cache = LLMCache()
@@ -0,0 +1,260 @@
+import os
+import re
+from dataclasses import dataclass
+from typing import Optional
+import numpy as np
+from dotenv import load_dotenv
+from engagement import EngagementTable, Score
+from prompt_compaction import URL_PATTERN, HASHTAG, clean_text
+
+# Load environment variables
+load_dotenv()
+fast_brief_terms = int(os.getenv("fast_brief_terms", "5"))  # hashtags, phrases and keywords listed per section
+
+TOKEN = re.compile(r"#\w+|\b[a-z][a-z0-9']{2,}\b")
+STOPWORDS = frozenset("""
+    the and for you your with this that from are was were have has had not but all any can our out get got just
+    what when where who why how its it's into onto about more most than then them they their there here will would
+    should could been being also only very much many some such each every over under again new now today day days
+    week one two three first last next make made like love one's don't can't won't i'm you're we're let's via amp
+    video videos watch full episode part shorts short channel subscribe follow link bio check comment comments share
+    post posts reel reels instagram youtube available description
+""".split())
+MAX_SNIPPET = 80
+
+@dataclass
+class Term:
+    text: str
+    documents: int  # posts or videos using the term in the summary window
+    accounts: int  # competitors using it
+    change: Optional[float]  # change in share of posts against the previous window; None without one
+    new: bool  # absent from a non-empty previous window
+    lift: float  # mean engagement score of the posts using it, 1.0 being each account's usual
+
+    @property
+    def rising(self):
+        return self.new or (self.change or 0) > 0
+
+    def describe(self, unit="posts"):
+        details = [_count(self.documents, unit), _count(self.accounts, "accounts")]
+        if self.new:
+            details.append("new")
+        elif self.change is not None:
+            details.append(f"{self.change:+.0%}")
+        return f"{self.text} ({', '.join(details)})"
+
+@dataclass
+class Trends:
+    documents: int
+    accounts: int
+    hashtags: list
+    phrases: list
+    keywords: list
+    by_account: dict  # handle -> [term, ...]
+
+def _count(number, plural):
+    return f"{number} {plural if number != 1 else plural[:-1]}"
+
+class _Corpus:
+    """
+    Token ids for a list of texts as flat arrays: the id of every token and
+    the index of the text it came from.
+    """
+
+    def __init__(self, texts):
+        token_lists = [TOKEN.findall(URL_PATTERN.sub(" ", (text or "").lower())) for text in texts]
+        self.size = len(texts)
+        self.tokens = [token for tokens in token_lists for token in tokens]
+        self.document = np.repeat(np.arange(self.size, dtype=np.int64), [len(tokens) for tokens in token_lists])
+        self.ids = None
+
+    def encode(self, vocabulary):
+        # One vocabulary for both windows so their ids can be compared
+        self.ids = np.fromiter(map(vocabulary.__getitem__, self.tokens), dtype=np.int64, count=len(self.tokens))
+
+def _distinct(values):
+    # Sort-based; np.unique without return_* takes a much slower hashing path on large int64 arrays in numpy 2
+    values = np.sort(values)
+    return values[np.concatenate(([True], values[1:] != values[:-1]))] if len(values) else values
+
+def _document_counts(keys, document, key_space, weights=None, groups=None):
+    # Count each key once per document; returns (unique keys, documents, distinct groups, mean document weight)
+    if not len(keys):
+        empty = np.empty(0, dtype=np.int64)
+        return empty, empty, empty, np.empty(0)
+    pairs = _distinct(document * key_space + keys)
+    pair_keys, pair_documents = pairs % key_space, pairs // key_space
+    unique_keys, inverse, documents = np.unique(pair_keys, return_inverse=True, return_counts=True)
+    spread = documents
+    if groups is not None:
+        group_pairs = _distinct(groups[pair_documents] * key_space + pair_keys) % key_space
+        spread = np.bincount(np.searchsorted(unique_keys, group_pairs), minlength=len(unique_keys))
+    lift = np.ones(len(unique_keys))
+    if weights is not None:
+        lift = np.bincount(inverse, weights=weights[pair_documents], minlength=len(unique_keys)) / documents
+    return unique_keys, documents, spread, lift
+
+def _terms(kind, limit, current, previous, key_space, weights, groups, decode):
+    # Rank by posts using the term, weighted by how many competitors share it and how fast it grew
+    selected = kind(current.ids, current.document)
+    unique_keys, documents, accounts, lift = _document_counts(selected[0], selected[1], key_space, weights, groups)
+    if not len(unique_keys):
+        return []
+    previous_keys, previous_documents, _, _ = _document_counts(*kind(previous.ids, previous.document), key_space)
+    before = np.zeros(len(unique_keys), dtype=np.int64)
+    if len(previous_keys):
+        found = np.minimum(np.searchsorted(previous_keys, unique_keys), len(previous_keys) - 1)
+        matched = previous_keys[found] == unique_keys
+        before[matched] = previous_documents[found[matched]]
+    # Change in share of posts, so a busier window does not make everything look like it is rising
+    change = (documents / current.size) / np.maximum(before / max(previous.size, 1), 1e-9) - 1
+    new = (before == 0) & (previous.size > 0)
+    growth = np.ones(len(unique_keys))
+    if previous.size:
+        growth = np.where(new, 2.0, 1 + np.clip(change, -0.5, 3.0))
+    rank = documents * np.sqrt(accounts) * growth
+    order = np.lexsort((unique_keys, -rank))
+    order = order[documents[order] >= min(2, documents.max())][:limit]  # Single mentions only when nothing repeats
+    return [
+        Term(decode(int(unique_keys[i])), int(documents[i]), int(accounts[i]),
+             round(float(change[i]), 2) if before[i] else None, bool(new[i]), round(float(lift[i]), 1))
+        for i in order
+    ]
+
+def extract_trends(texts, handles, previous_texts, scores=None, limit=None):
+    """
+    Count hashtags, two-word phrases and keywords across the texts of the
+    summary window, compare their share of posts with the previous window
+    and list each account's most used topics. scores, one per text, are the
+    engagement scores averaged into each term's lift.
+    """
+    limit = limit or fast_brief_terms
+    current, previous = _Corpus(texts), _Corpus(previous_texts)
+    words = list(dict.fromkeys(current.tokens + previous.tokens))
+    vocabulary = {word: i for i, word in enumerate(words)}
+    current.encode(vocabulary)
+    previous.encode(vocabulary)
+    size = max(len(words), 1)
+    is_hashtag = np.array([word.startswith("#") for word in words], dtype=bool)
+    is_stopword = np.array([word in STOPWORDS for word in words], dtype=bool)
+    is_word = ~is_hashtag & ~is_stopword
+
+    handles = np.asarray(handles, dtype=str)
+    accounts, groups = np.unique(handles, return_inverse=True)
+    weights = None if scores is None else np.nan_to_num(np.asarray(scores, dtype=float), nan=1.0)
+
+    def hashtags(ids, document):
+        return ids[is_hashtag[ids]], document[is_hashtag[ids]]
+
+    def keywords(ids, document):
+        return ids[is_word[ids]], document[is_word[ids]]
+
+    def phrases(ids, document):
+        # Adjacent keyword pairs inside the same text
+        if len(ids) < 2:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+        keep = (document[1:] == document[:-1]) & is_word[ids[1:]] & is_word[ids[:-1]]
+        return ids[:-1][keep] * size + ids[1:][keep], document[1:][keep]
+
+    def phrase_text(key):
+        return f"{words[key // size]} {words[key % size]}"
+
+    # Each account's three most used keywords and hashtags
+    by_account = {}
+    is_topic = is_word | is_hashtag
+    topic_ids, topic_documents = current.ids[is_topic[current.ids]], current.document[is_topic[current.ids]]
+    if len(topic_ids):
+        pairs, counts = np.unique(groups[topic_documents] * size + topic_ids, return_counts=True)
+        order = np.lexsort((pairs % size, -counts, pairs // size))
+        pair_groups = (pairs // size)[order]
+        starts = np.searchsorted(pair_groups, np.arange(len(accounts)))
+        for group, start in enumerate(starts):
+            top = [i for i in order[start:start + 3] if pairs[i] // size == group]
+            if top:
+                by_account[str(accounts[group])] = [str(words[pairs[i] % size]) for i in top]
+
+    return Trends(
+        documents=current.size,
+        accounts=len(accounts),
+        hashtags=_terms(hashtags, limit, current, previous, size, weights, groups, lambda key: str(words[key])),
+        phrases=_terms(phrases, limit, current, previous, size * size, weights, groups, phrase_text),
+        keywords=_terms(keywords, limit, current, previous, size, weights, groups, lambda key: str(words[key])),
+        by_account=by_account,
+    )
+
+def _snippet(text):
+    text = " ".join((text or "").split())
+    return text if len(text) <= MAX_SNIPPET else text[:MAX_SNIPPET - 1].rstrip() + "…"
+
+def _join(terms, unit):
+    return ", ".join(term.describe(unit) for term in terms)
+
+def render_trends(trends, unit, best=None):
+    """
+    Write a trend and a recommendation paragraph from extracted trends, in the
+    shape of the Gemini brief sections. best is an optional (handle, text, score)
+    for the item that most beat its account's usual numbers.
+    """
+    if not trends.documents:
+        return f"No {unit} in the summary window.", f"Nothing to recommend until competitors publish new {unit}."
+    sentences = [f"Across {_count(trends.documents, unit)} from {_count(trends.accounts, 'accounts')}"]
+    if trends.hashtags:
+        sentences[0] += f", the most used hashtags were {_join(trends.hashtags, unit)}"
+    sentences[0] += "."
+    if trends.phrases:
+        sentences.append(f"Recurring phrases: {_join(trends.phrases, unit)}.")
+    if trends.keywords:
+        sentences.append(f"Top keywords: {_join(trends.keywords, unit)}.")
+    if trends.by_account:
+        sentences.append("By account: " + "; ".join(f"{handle}: {', '.join(terms)}" for handle, terms in trends.by_account.items()) + ".")
+    trend = " ".join(sentences)
+
+    advice = []
+    rising = [term.text for term in trends.hashtags if term.rising][:3]
+    if rising:
+        advice.append(f"Use {', '.join(rising)} while they are rising among competitors.")
+    topics = sorted(trends.phrases + trends.keywords, key=lambda term: -term.lift)
+    if topics and topics[0].lift > 1:
+        advice.append(f"Build content around \"{topics[0].text}\": {unit} using it averaged {topics[0].lift:.1f}x their account's usual engagement.")
+    shared = [term.text for term in trends.phrases + trends.keywords if term.accounts > 1][:3]
+    if shared:
+        advice.append(f"Several competitors are covering {', '.join(shared)}; a distinct angle on these will stand out.")
+    if best and best[2].relative > 1:
+        handle, text, score = best
+        advice.append(f"Study {handle}'s \"{_snippet(text)}\", which reached {score.relative:.1f}x its usual engagement.")
+    return trend, " ".join(advice) or "Not enough repeated topics yet to recommend a direction."
+
+def _best(table, handles, texts):
+    # The engagement scores of every item, and (handle, text, Score) for the highest
+    score, relative, velocity = table.scores()
+    if np.isnan(score).all():
+        return None, score
+    i = int(np.nanargmax(score))
+    return (handles[i], texts[i], Score(round(float(score[i]), 1), round(float(relative[i]), 1), round(float(velocity[i]), 1))), score
+
+def analyze_posts(posts, previous_posts):
+    """
+    Return (trend, recommendation) text for Instagram posts without calling Gemini.
+    """
+    handles = [post.get("username") for post in posts]
+    captions = [post.get("caption") or "" for post in posts]
+    table = EngagementTable(handles, [post.get("likes") for post in posts], [post.get("timestamp") for post in posts])
+    best, scores = _best(table, handles, captions)
+    trends = extract_trends(captions, handles, [post.get("caption") or "" for post in previous_posts], scores)
+    return render_trends(trends, "posts", best)
+
+def _video_text(video):
+    # Descriptions lose their hashtag walls and footers in clean_text, but the hashtags themselves are signal
+    return f"{video.title}\n{clean_text(video.description)}\n{' '.join(HASHTAG.findall(video.description or ''))}"
+
+def analyze_videos(videos_by_handle, previous_videos_by_handle):
+    """
+    Return (trend, recommendation) text for YouTube videos without calling Gemini.
+    """
+    rows = [(handle, video) for handle, videos in videos_by_handle.items() for video in videos]
+    handles = [handle for handle, _ in rows]
+    table = EngagementTable(handles, [video.view_count for _, video in rows], [video.published_at for _, video in rows])
+    best, scores = _best(table, handles, [video.title for _, video in rows])
+    trends = extract_trends([_video_text(video) for _, video in rows], handles,
+                            [_video_text(video) for videos in previous_videos_by_handle.values() for video in videos], scores)
+    return render_trends(trends, "videos", best)
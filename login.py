@@ -1,24 +1,9 @@
 import streamlit as st
 import sqlite3
+import db
 import hashlib
 from app import valid_user_yt, valid_user_insta, valid_email #import verification functions
 
-# DB setup
-def init_db():
-    with sqlite3.connect("users.db", check_same_thread=False) as conn:
-        cursor = conn.cursor()
-        cursor.execute("""CREATE TABLE IF NOT EXISTS users (
-            username TEXT PRIMARY KEY,
-            password TEXT,
-            youtube_id TEXT,
-            instagram_id TEXT,
-            email TEXT NOT NULL,
-            summary_date TEXT 
-            )""")
-        conn.commit()
-
-init_db()  # Initialize the database
-
 def hash_password(password):
     return hashlib.sha256(password.encode()).hexdigest() # Hashing passwords for security
 
@@ -63,34 +48,28 @@ def login():
                 st.error("Invalid Email ID.")
                 return
             try:
-                with sqlite3.connect("users.db", check_same_thread=False) as conn:
-                    cursor = conn.cursor() # Insert new user into the database
-                    # Added None for the new summary_date column
-                    cursor.execute("INSERT INTO users VALUES (?, ?, ?, ?, ?, ?)",
-                                   (username, hashed_password, youtube if youtube else None, insta if insta else None, email, None))
-                    conn.commit() #save changes
-                    st.success("Account created successfully!")
-                    st.session_state["logged_in"] = True # Store login state
-                    st.session_state["username"] = username # Store username in session state
-                    st.session_state["page"] = "home" # Store username in session state
-                    st.rerun() # Reload the app
+                # Insert new user into the database, None for the summary_date column
+                db.execute(db.USERS, "INSERT INTO users (username, password, youtube_id, instagram_id, email, summary_date) VALUES (?, ?, ?, ?, ?, ?)",
+                           (username, hashed_password, youtube if youtube else None, insta if insta else None, email, None))
             except sqlite3.IntegrityError:
                 st.error("Username already exists. Please choose a different username.")
+                return
+            st.success("Account created successfully!")
+            st.session_state["logged_in"] = True # Store login state
+            st.session_state["username"] = username # Store username in session state
+            st.session_state["page"] = "home" # Store username in session state
+            st.rerun() # Reload the app
 
     elif option == "Login":
         if st.button("Login"):
             hashed_password = hash_password(password)
-            with sqlite3.connect("users.db", check_same_thread=False) as conn:
-                cursor = conn.cursor()
-                cursor.execute("SELECT * FROM users WHERE username=? AND password=?", (username, hashed_password))
-                user = cursor.fetchone() # Fetch user data
-                if user:
-                    st.session_state["logged_in"] = True # Store login state
-                    st.session_state["username"] = username # Store username in session state
-                    st.session_state["page"] = "home"
-                    st.session_state["show_login_message"] = True  # Show login message
-                    st.rerun() # Reload the app
+            user = db.query_one(db.USERS, "SELECT username FROM users WHERE username=? AND password=?", (username, hashed_password)) # Fetch user data
+            if user:
+                st.session_state["logged_in"] = True # Store login state
+                st.session_state["username"] = username # Store username in session state
+                st.session_state["page"] = "home"
+                st.session_state["show_login_message"] = True  # Show login message
+                st.rerun() # Reload the app
 
-                else:
-                    st.error("Invalid username or password.")
-# conn.close() # even tho it closes the database connection, # Removed to avoid closing the connection at module level
+            else:
+                st.error("Invalid username or password.")
@@ -0,0 +1,198 @@
+import os
+import random
+import smtplib
+import threading
+import time
+from email.mime.text import MIMEText
+from dotenv import load_dotenv
+import db
+import metrics
+
+# Load environment variables
+load_dotenv()
+sender_email_id = os.getenv("sender_email_id")
+sender_email_id_password = os.getenv("sender_email_id_password")
+smtp_host = os.getenv("smtp_host", "smtp.gmail.com")
+smtp_port = int(os.getenv("smtp_port", "587"))
+smtp_starttls = os.getenv("smtp_starttls", "true").lower() != "false"
+mail_batch_size = int(os.getenv("mail_batch_size", "20"))
+mail_max_attempts = int(os.getenv("mail_max_attempts", "6"))
+mail_poll_interval = float(os.getenv("mail_poll_interval", "2"))  # seconds
+
+SENDING_TIMEOUT = 600  # seconds before a message stuck in 'sending' is picked up again
+
+def enqueue_mail(recipient, subject, body, subtype="html"):
+    """
+    Add a message to the outbox and return its ID. The sender worker delivers it.
+    """
+    now = time.time()
+    cursor = db.execute(db.USERS, """
+        INSERT INTO outbox (recipient, subject, body, subtype, next_attempt_at, created_at)
+        VALUES (?, ?, ?, ?, ?, ?)
+    """, (recipient, subject, body, subtype, now, now))
+    return cursor.lastrowid
+
+def build_message(recipient, subject, body, subtype="html"):
+    msg = MIMEText(body, subtype)
+    msg['Subject'] = subject
+    msg['From'] = sender_email_id
+    msg['To'] = recipient
+    return msg
+
+class SmtpConnection:
+    """
+    One authenticated SMTP connection that is kept open between messages and
+    reopened when the server drops it.
+    """
+
+    def __init__(self, idle_timeout=60):
+        self.smtp = None
+        self.idle_timeout = idle_timeout
+        self.last_used = 0
+        self.lock = threading.Lock()
+
+    def _connect(self):
+        metrics.increment("smtp_connects")
+        smtp = smtplib.SMTP(smtp_host, smtp_port, timeout=30)
+        if smtp_starttls:
+            smtp.starttls()
+        if sender_email_id and sender_email_id_password:
+            smtp.login(sender_email_id, sender_email_id_password)
+        self.smtp = smtp
+
+    def close(self):
+        if self.smtp:
+            try:
+                self.smtp.quit()
+            except Exception:
+                pass
+            self.smtp = None
+
+    def close_if_idle(self):
+        with self.lock:
+            if self.smtp and time.monotonic() - self.last_used > self.idle_timeout:
+                self.close()
+
+    def send(self, msg):
+        metrics.increment("api_calls", service="smtp")
+        with self.lock, metrics.span("smtp.send", platform="email"):
+            if self.smtp is None:
+                self._connect()
+            try:
+                self.smtp.send_message(msg)
+            except smtplib.SMTPServerDisconnected:
+                self._reconnect_and_send(msg)
+            except smtplib.SMTPException:
+                raise  # Refused recipient, sender or data: resending would fail again or deliver twice
+            except OSError:
+                self._reconnect_and_send(msg)  # Socket error on a stale connection
+            self.last_used = time.monotonic()
+
+    def _reconnect_and_send(self, msg):
+        self.close()  # Stale connection, reconnect once and retry
+        self._connect()
+        self.smtp.send_message(msg)
+
+smtp_connection = SmtpConnection()
+
+def send_now(recipient, subject, body, subtype="plain"):
+    """
+    Send a message immediately over the shared connection. Used where the caller
+    needs the result, such as email verification.
+    """
+    smtp_connection.send(build_message(recipient, subject, body, subtype))
+
+def _claim_batch(limit):
+    now = time.time()
+    with db.transaction(db.USERS, immediate=True) as conn:
+        rows = conn.execute("""
+            SELECT id, recipient, subject, body, subtype, attempts FROM outbox
+            WHERE (status = 'pending' AND next_attempt_at <= ?)
+                OR (status = 'sending' AND claimed_at < ?)
+            ORDER BY next_attempt_at LIMIT ?
+        """, (now, now - SENDING_TIMEOUT, limit)).fetchall()
+        conn.executemany("UPDATE outbox SET status = 'sending', claimed_at = ? WHERE id = ?",
+                         [(now, row[0]) for row in rows])
+    return rows
+
+def _backoff(attempts):
+    return min(3600, 30 * 2 ** attempts) * random.uniform(0.5, 1.0)  # Jittered exponential backoff
+
+def _record(results):
+    now = time.time()
+    with db.transaction(db.USERS) as conn:
+        cursor = conn.cursor()
+        for message_id, attempts, error in results:
+            if error is None:
+                cursor.execute("UPDATE outbox SET status = 'sent', sent_at = ?, last_error = NULL WHERE id = ?",
+                               (now, message_id))
+            elif attempts + 1 >= mail_max_attempts:
+                cursor.execute("UPDATE outbox SET status = 'failed', attempts = ?, last_error = ? WHERE id = ?",
+                               (attempts + 1, error, message_id))
+            else:
+                cursor.execute("""
+                    UPDATE outbox SET status = 'pending', attempts = ?, next_attempt_at = ?, last_error = ?
+                    WHERE id = ?
+                """, (attempts + 1, now + _backoff(attempts), error, message_id))
+
+def send_pending(limit=mail_batch_size):
+    """
+    Deliver one batch of due outbox messages over the shared connection.
+    Returns the number of messages claimed.
+    """
+    rows = _claim_batch(limit)
+    results = []
+    for message_id, recipient, subject, body, subtype, attempts in rows:
+        try:
+            smtp_connection.send(build_message(recipient, subject, body, subtype))
+            results.append((message_id, attempts, None))
+        except Exception as e:
+            print(f"Failed to send mail {message_id} to {recipient}: {str(e)}")
+            metrics.increment("failures", stage="smtp.send")
+            with smtp_connection.lock:
+                smtp_connection.close()  # Start the next message on a fresh connection
+            results.append((message_id, attempts, str(e)))
+    if results:
+        _record(results)
+    return len(rows)
+
+class MailSender(threading.Thread):
+    """
+    Background worker that drains the outbox in batches.
+    """
+
+    def __init__(self, poll_interval=mail_poll_interval):
+        super().__init__(name="mail-sender", daemon=True)
+        self.poll_interval = poll_interval
+
+    def run(self):
+        while True:
+            try:
+                claimed = send_pending()
+            except Exception as e:
+                print(f"Mail sender error: {str(e)}")
+                claimed = 0
+            if not claimed:
+                smtp_connection.close_if_idle()  # Servers drop idle sessions anyway
+                time.sleep(self.poll_interval)
+
+_sender = None
+_sender_lock = threading.Lock()
+
+def start_sender():
+    """
+    Start the background sender for this process if it is not already running.
+    """
+    global _sender
+    with _sender_lock:
+        if _sender is None or not _sender.is_alive():
+            _sender = MailSender()
+            _sender.start()
+    return _sender
+
+if __name__ == "__main__":
+    print("Starting mail sender")
+    try:
+        start_sender().join()
+    except KeyboardInterrupt:
+        print("Mail sender stopped")
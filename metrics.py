@@ -0,0 +1,240 @@
+import os
+import json
+import time
+import logging
+import threading
+import contextvars
+from collections import defaultdict, deque
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from dotenv import load_dotenv
+
+# Load environment variables
+load_dotenv()
+metrics_file = os.getenv("metrics_file")  # Prometheus text file, rewritten every metrics_interval seconds
+metrics_port = int(os.getenv("metrics_port", "0"))  # Serve /metrics on this port when set
+metrics_interval = float(os.getenv("metrics_interval", "15"))  # seconds
+metrics_log_file = os.getenv("metrics_log_file")  # JSON span logs; stderr when unset
+metrics_window = int(os.getenv("metrics_window", "1000"))  # recent durations kept per stage for percentiles
+
+PREFIX = "social_pulse"
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)  # seconds
+LABELS = ("stage", "platform")  # User and handle stay in the JSON logs; as labels they would explode the series count
+
+_tags = contextvars.ContextVar("metrics_tags", default={})
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record):
+        entry = {"time": self.formatTime(record, "%Y-%m-%dT%H:%M:%S%z"), "level": record.levelname, "message": record.getMessage()}
+        entry.update(getattr(record, "fields", {}))
+        return json.dumps(entry, default=str)
+
+logger = logging.getLogger("social_pulse")
+if not logger.handlers:
+    _handler = logging.FileHandler(metrics_log_file) if metrics_log_file else logging.StreamHandler()
+    _handler.setFormatter(JsonFormatter())
+    logger.addHandler(_handler)
+    logger.setLevel(logging.INFO)
+    logger.propagate = False
+
+class Registry:
+    """
+    In-process store for stage timings and event counters. Timings feed both a
+    Prometheus histogram and a window of recent durations used for percentiles.
+    """
+
+    def __init__(self, window=metrics_window):
+        self.lock = threading.Lock()
+        self.window = window
+        self.histograms = {}  # label tuple -> [bucket counts, sum, count]
+        self.recent = defaultdict(lambda: deque(maxlen=self.window))
+        self.errors = defaultdict(int)
+        self.counters = defaultdict(int)  # (name, sorted label items) -> value
+
+    def observe(self, labels, seconds, failed=False):
+        with self.lock:
+            histogram = self.histograms.setdefault(labels, [[0] * len(BUCKETS), 0.0, 0])
+            for i, bound in enumerate(BUCKETS):
+                if seconds <= bound:
+                    histogram[0][i] += 1
+            histogram[1] += seconds
+            histogram[2] += 1
+            self.recent[labels].append(seconds)
+            if failed:
+                self.errors[labels] += 1
+
+    def increment(self, name, amount=1, **labels):
+        with self.lock:
+            self.counters[(name, tuple(sorted(labels.items())))] += amount
+
+    def stage_summary(self):
+        """
+        Return one dict per stage and platform with count, errors and p50/p95/max in milliseconds.
+        """
+        with self.lock:
+            snapshot = {labels: (sorted(values), self.histograms[labels][2], self.errors[labels])
+                        for labels, values in self.recent.items()}
+        rows = []
+        for (stage, platform), (values, count, errors) in sorted(snapshot.items()):
+            rows.append({
+                "stage": stage, "platform": platform, "count": count, "errors": errors,
+                "p50_ms": _percentile(values, 0.50) * 1000,
+                "p95_ms": _percentile(values, 0.95) * 1000,
+                "max_ms": values[-1] * 1000 if values else 0.0,
+            })
+        return rows
+
+    def counter_summary(self):
+        with self.lock:
+            return [{"name": name, **dict(labels), "value": value} for (name, labels), value in sorted(self.counters.items())]
+
+    def render_prometheus(self):
+        """
+        Render every metric in the Prometheus text exposition format.
+        """
+        with self.lock:
+            histograms = {labels: (list(h[0]), h[1], h[2]) for labels, h in self.histograms.items()}
+            errors = dict(self.errors)
+            counters = dict(self.counters)
+        lines = [
+            f"# HELP {PREFIX}_stage_duration_seconds Time spent in each pipeline stage and external call.",
+            f"# TYPE {PREFIX}_stage_duration_seconds histogram",
+        ]
+        for labels, (buckets, total, count) in sorted(histograms.items()):
+            base = _format_labels(zip(LABELS, labels))
+            for bound, value in zip(BUCKETS, buckets):
+                lines.append(f'{PREFIX}_stage_duration_seconds_bucket{{{base},le="{bound}"}} {value}')
+            lines.append(f'{PREFIX}_stage_duration_seconds_bucket{{{base},le="+Inf"}} {count}')
+            lines.append(f"{PREFIX}_stage_duration_seconds_sum{{{base}}} {total}")
+            lines.append(f"{PREFIX}_stage_duration_seconds_count{{{base}}} {count}")
+        lines += [
+            f"# HELP {PREFIX}_stage_failures_total Spans that ended in an exception.",
+            f"# TYPE {PREFIX}_stage_failures_total counter",
+        ]
+        for labels, value in sorted(errors.items()):
+            lines.append(f"{PREFIX}_stage_failures_total{{{_format_labels(zip(LABELS, labels))}}} {value}")
+        for name in sorted({name for name, _ in counters}):
+            lines.append(f"# TYPE {PREFIX}_{name}_total counter")
+            for (counter_name, labels), value in sorted(counters.items()):
+                if counter_name == name:
+                    lines.append(f"{PREFIX}_{name}_total{{{_format_labels(labels)}}} {value}")
+        return "\n".join(lines) + "\n"
+
+def _percentile(values, fraction):
+    if not values:
+        return 0.0
+    return values[min(len(values) - 1, int(fraction * len(values)))]
+
+def _format_labels(pairs):
+    return ",".join(f'{key}="{str(value).replace(chr(92), chr(92) * 2).replace(chr(34), chr(92) + chr(34))}"' for key, value in pairs)
+
+registry = Registry()
+
+@contextmanager
+def tagged(**tags):
+    """
+    Add tags such as user, platform and handle to every span inside the block.
+    Thread pools must run work in a copy of the context (contextvars.copy_context().run).
+    """
+    token = _tags.set({**_tags.get(), **{key: value for key, value in tags.items() if value is not None}})
+    try:
+        yield
+    finally:
+        _tags.reset(token)
+
+@contextmanager
+def span(stage, log=True, **tags):
+    """
+    Time a pipeline stage or external call. The duration is recorded under the
+    stage and platform tags, and a JSON log line carries every tag in scope.
+    Exceptions are counted as failures and re-raised.
+    """
+    with tagged(**tags):
+        fields = dict(_tags.get())
+        start = time.perf_counter()
+        failed = False
+        try:
+            yield fields  # Callers may add result fields, e.g. item counts
+        except BaseException as e:
+            failed = True
+            fields["error"] = f"{type(e).__name__}: {e}"
+            raise
+        finally:
+            seconds = time.perf_counter() - start
+            registry.observe((stage, fields.get("platform", "")), seconds, failed)
+            if log or failed:
+                entry = {"stage": stage, "duration_ms": round(seconds * 1000, 2), "status": "error" if failed else "ok", **fields}
+                logger.log(logging.ERROR if failed else logging.INFO, stage, extra={"fields": entry})
+
+def increment(name, amount=1, **labels):
+    """
+    Add to a counter such as api_calls, cache_hits, retries or failures.
+    """
+    registry.increment(name, amount, **labels)
+
+def event(message, **fields):
+    """
+    Write a structured log line with the tags in scope.
+    """
+    logger.info(message, extra={"fields": {**_tags.get(), **fields}})
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?")[0] != "/metrics":
+            self.send_error(404)
+            return
+        body = registry.render_prometheus().encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass  # Scrapes would otherwise flood stderr
+
+class MetricsExporter(threading.Thread):
+    """
+    Background worker that rewrites the Prometheus text file every interval.
+    """
+
+    def __init__(self, path=metrics_file, interval=metrics_interval):
+        super().__init__(name="metrics-exporter", daemon=True)
+        self.path = path
+        self.interval = interval
+
+    def run(self):
+        while True:
+            try:
+                temporary = f"{self.path}.tmp"
+                with open(temporary, "w") as f:
+                    f.write(registry.render_prometheus())
+                os.replace(temporary, self.path)  # Scrapers never see a half-written file
+            except OSError as e:
+                print(f"Error writing metrics file: {str(e)}")
+            time.sleep(self.interval)
+
+_exporters = []
+_exporters_lock = threading.Lock()
+
+def start_metrics_exporter(port=metrics_port, path=metrics_file):
+    """
+    Start the metrics file writer and /metrics endpoint configured for this
+    process, once. Each is skipped when its setting is empty.
+    """
+    with _exporters_lock:
+        if _exporters:
+            return
+        if path:
+            exporter = MetricsExporter(path)
+            exporter.start()
+            _exporters.append(exporter)
+        if port:
+            try:
+                server = ThreadingHTTPServer(("", port), _MetricsHandler)
+            except OSError as e:
+                print(f"Error starting metrics endpoint on port {port}: {str(e)}")
+            else:
+                threading.Thread(target=server.serve_forever, name="metrics-endpoint", daemon=True).start()
+                _exporters.append(server)
+        _exporters.append(None)  # Mark as started even when nothing is configured
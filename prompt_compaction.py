@@ -0,0 +1,131 @@
+import os
+import re
+import math
+from collections import Counter
+from dataclasses import dataclass
+from dotenv import load_dotenv
+
+# Load environment variables
+load_dotenv()
+prompt_token_budget = int(os.getenv("prompt_token_budget", "6000"))  # per platform
+
+URL_PATTERN = re.compile(r"https?://\S+|www\.\S+")
+TIMESTAMP_LINE = re.compile(r"^\W*\d{1,2}:\d{2}(?::\d{2})?\b")
+HASHTAG = re.compile(r"#\w+")
+HASHTAG_TAIL = re.compile(r"(?:\s*#\w+){3,}\s*$")
+SOCIAL_LINE = re.compile(r"^\W*(?:(?:follow|subscribe|instagram|twitter|tiktok|facebook|linkedin|threads|discord)\b|x(?:\.com/|(?:\.com)?\s*[:@]))", re.IGNORECASE)  # "X" only as "X: @brand" or "x.com/brand"
+CHARS_PER_TOKEN = 4  # Rough average for English text with Gemini's tokenizer
+MIN_BOILERPLATE_ITEMS = 3
+BOILERPLATE_SHARE = 0.5  # A line is boilerplate when it is in at least this share of an account's items
+
+@dataclass
+class CompactionStats:
+    tokens_before: int = 0
+    tokens_after: int = 0
+
+    @property
+    def tokens_saved(self):
+        return self.tokens_before - self.tokens_after
+
+def estimate_tokens(text):
+    return (len(text) + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN
+
+def _clean_line(line):
+    line = URL_PATTERN.sub("", line).strip()
+    if not line or TIMESTAMP_LINE.match(line):
+        return ""
+    words = line.split()
+    hashtags = HASHTAG.findall(line)
+    if len(hashtags) >= 3 and len(hashtags) >= 0.6 * len(words):
+        return ""  # Hashtag wall
+    if SOCIAL_LINE.match(line) and len(words) <= 8:
+        return ""  # "Follow us on Instagram: @brand" style footer
+    if line.endswith(":") and len(words) <= 3:
+        return ""  # Label left behind by a stripped link
+    return " ".join(words)
+
+def clean_text(text):
+    """
+    Strip URLs, chapter timestamps, hashtag walls and social footers from a caption or description.
+    """
+    text = HASHTAG_TAIL.sub("", text or "")
+    lines = [_clean_line(line) for line in text.splitlines()]
+    return "\n".join(line for line in lines if line)
+
+def _dedupe_lines(texts, drop_repeated):
+    # Lines in most of an account's items are boilerplate; recurring series titles or sponsors in a few are kept
+    seen_in = Counter(line for text in texts for line in set(text.splitlines()))
+    threshold = max(MIN_BOILERPLATE_ITEMS, math.ceil(BOILERPLATE_SHARE * len(texts)))
+    compacted = []
+    for text in texts:
+        kept = []
+        for line in text.splitlines():
+            if drop_repeated and seen_in[line] >= threshold:
+                continue
+            if line not in kept:
+                kept.append(line)
+        compacted.append("\n".join(kept))
+    return compacted
+
+def _fit_to_budget(texts, budget_chars):
+    # Water-fill: find the largest per-item cap whose total fits, then trim everything above it
+    total = sum(len(text) for text in texts)
+    if total <= budget_chars:
+        return texts
+    lengths = sorted(len(text) for text in texts)
+    remaining, cap = budget_chars, 0
+    for i, length in enumerate(lengths):
+        share = remaining // (len(lengths) - i)
+        if length > share:
+            cap = share
+            break
+        remaining -= length
+    return [text if len(text) <= cap else text[:max(cap - 1, 0)].rstrip() + "…" for text in texts]
+
+def compact_videos(videos_by_handle, token_budget=None):
+    """
+    Compact YouTube descriptions per channel and trim them to the token budget.
+    Returns ({handle: [Video, ...]}, CompactionStats); the input videos are not modified.
+    """
+    stats = CompactionStats()
+    handles = list(videos_by_handle)
+    descriptions = []
+    for handle in handles:
+        videos = videos_by_handle[handle]
+        stats.tokens_before += sum(estimate_tokens(video.title) + estimate_tokens(video.description) for video in videos)
+        cleaned = [clean_text(video.description) for video in videos]
+        descriptions.append(_dedupe_lines(cleaned, drop_repeated=len(videos) >= MIN_BOILERPLATE_ITEMS))
+
+    title_chars = sum(len(video.title) for videos in videos_by_handle.values() for video in videos)
+    budget_chars = max((token_budget or prompt_token_budget) * CHARS_PER_TOKEN - title_chars, 0)
+    flat = _fit_to_budget([text for channel in descriptions for text in channel], budget_chars)
+
+    compacted, position = {}, 0
+    for handle, channel in zip(handles, descriptions):
+        compacted[handle] = []
+        for video in videos_by_handle[handle]:
+            description = flat[position] or "No description available"
+            position += 1
+            compacted[handle].append(video.model_copy(update={"description": description}))
+            stats.tokens_after += estimate_tokens(video.title) + estimate_tokens(description)
+    return compacted, stats
+
+def compact_posts(posts, token_budget=None):
+    """
+    Compact Instagram captions per account and trim them to the token budget.
+    Returns ([post, ...], CompactionStats); the input posts are not modified.
+    """
+    stats = CompactionStats(tokens_before=sum(estimate_tokens(post.get("caption") or "") for post in posts))
+    by_account = {}
+    for i, post in enumerate(posts):
+        by_account.setdefault(post.get("username"), []).append(i)
+    captions = [""] * len(posts)
+    for indexes in by_account.values():
+        cleaned = _dedupe_lines([clean_text(posts[i].get("caption")) for i in indexes],
+                                drop_repeated=len(indexes) >= MIN_BOILERPLATE_ITEMS)
+        for i, caption in zip(indexes, cleaned):
+            captions[i] = caption
+    captions = _fit_to_budget(captions, (token_budget or prompt_token_budget) * CHARS_PER_TOKEN)
+    compacted = [dict(post, caption=caption or "No caption") for post, caption in zip(posts, captions)]
+    stats.tokens_after = sum(estimate_tokens(post["caption"]) for post in compacted)
+    return compacted, stats
@@ -2,13 +2,20 @@ import streamlit as st
 import json
 import os
 import time
-from auto_email import send_auto_email
 st.set_page_config(page_title="Social Pulse", page_icon="🤖")
 
 from login import login
 from home import home
 from dashboard import dashboard
 from app import trend_analysis
+from mailer import start_sender
+from token_manager import start_token_refresher
+from admin import admin_panel
+from metrics import start_metrics_exporter
+
+start_sender()  # Delivers queued briefs in the background; no-op once running
+start_token_refresher()  # Keeps the Instagram token fresh so pages never exchange it
+start_metrics_exporter()  # Prometheus file and endpoint, when configured
 
 # Function to load competitor data (copied from test_app.py)
 def load_data():
@@ -27,7 +34,7 @@ def main():
         st.session_state["logged_in"] = False
         st.session_state["username"] = None
         st.session_state["show_login_message"] = False #flag for login msg
-    if "page" not in st.session_state or st.session_state["page"] not in ["login", "home", "dashboard", "trend_analysis"]:
+    if "page" not in st.session_state or st.session_state["page"] not in ["login", "home", "dashboard", "trend_analysis", "admin"]:
         st.session_state["page"] = "login"
     # Initialize competitors to avoid KeyError in trend_analysis
     if 'competitors' not in st.session_state:
@@ -50,7 +57,8 @@ def main():
         dashboard()
     elif st.session_state["page"] == "trend_analysis":
         trend_analysis()
+    elif st.session_state["page"] == "admin":
+        admin_panel()
 
 if __name__ == "__main__":
     main()
-    send_auto_email()
@@ -0,0 +1,127 @@
+import os
+import argparse
+import heapq
+import threading
+import time
+from datetime import datetime
+from dateutil import tz
+from dotenv import load_dotenv
+from mailer import start_sender
+from token_manager import start_token_refresher
+from metrics import start_metrics_exporter
+from auto_email import load_upcoming, next_claim_at, claim_due_users, run_cycle, worker_id, CHECK_TIME_THRESHOLD
+
+# Load environment variables
+load_dotenv()
+scheduler_refresh_interval = int(os.getenv("scheduler_refresh_interval", "300"))  # seconds
+scheduler_queue_size = int(os.getenv("scheduler_queue_size", "1000"))
+worker_batch_size = int(os.getenv("worker_batch_size", "20"))
+
+class BriefScheduler:
+    """
+    Keeps a priority queue of users ordered by when their next brief is due and
+    sleeps until the earliest deadline. The queue is reloaded from the
+    summary_date index every refresh interval to pick up new users and briefs
+    sent from the app.
+    """
+
+    def __init__(self, refresh_interval=scheduler_refresh_interval, queue_size=scheduler_queue_size):
+        self.owner = worker_id(":scheduler")
+        self.refresh_interval = refresh_interval
+        self.queue_size = queue_size
+        self.queue = []
+        self.loaded_at = 0
+
+    def reload(self):
+        self.queue = load_upcoming(self.queue_size)
+        heapq.heapify(self.queue)
+        self.loaded_at = time.monotonic()
+
+    def pop_due(self, now):
+        due = []
+        while self.queue and self.queue[0][0] <= now:
+            due.append(heapq.heappop(self.queue)[1])
+        return due
+
+    def run_once(self):
+        """
+        Run every brief that is due now. Returns the number of seconds to sleep before the next check.
+        """
+        if time.monotonic() - self.loaded_at >= self.refresh_interval:
+            self.reload()
+        now = datetime.now(tz.tzutc())
+        due = self.pop_due(now)
+        if due:
+            run_cycle(claim_due_users(self.owner, len(due), usernames=due, now=now), self.owner)
+            for username in due:
+                heapq.heappush(self.queue, (now + CHECK_TIME_THRESHOLD, username))
+            return 0
+        until_reload = self.refresh_interval - (time.monotonic() - self.loaded_at)
+        if not self.queue:
+            return max(until_reload, 0)
+        return max(min((self.queue[0][0] - now).total_seconds(), until_reload), 0)
+
+    def run_forever(self):
+        while True:
+            delay = self.run_once()
+            if delay:
+                time.sleep(delay)
+
+class LeaseWorker(threading.Thread):
+    """
+    Worker-pool mode. Each worker repeatedly leases a batch of due users through
+    the database, so any number of workers on one or more hosts sharing users.db
+    send exactly one brief per user per cycle. Idle workers sleep until the next
+    deadline, bounded by the poll interval.
+    """
+
+    def __init__(self, index, batch_size=worker_batch_size, poll_interval=scheduler_refresh_interval):
+        super().__init__(name=f"brief-worker-{index}", daemon=True)
+        self.owner = worker_id(f":{index}")
+        self.batch_size = batch_size
+        self.poll_interval = poll_interval
+
+    def run_once(self):
+        claimed = claim_due_users(self.owner, self.batch_size)
+        if claimed:
+            run_cycle(claimed, self.owner)
+            return 0
+        now = datetime.now(tz.tzutc())
+        wake_at = next_claim_at(now)
+        if not wake_at:
+            return self.poll_interval
+        until_due = (wake_at - now).total_seconds()
+        return min(max(until_due, 1), self.poll_interval)
+
+    def run(self):
+        while True:
+            try:
+                delay = self.run_once()
+            except Exception as e:
+                print(f"{self.name} error: {str(e)}")
+                delay = self.poll_interval
+            if delay:
+                time.sleep(delay)
+
+if __name__ == "__main__":
+    arg_parser = argparse.ArgumentParser(description="Send scheduled trend briefs.")
+    arg_parser.add_argument("--workers", type=int, default=0, help="run N leased workers instead of the single scheduler")
+    arg_parser.add_argument("--batch-size", type=int, default=worker_batch_size, help="users leased per worker batch")
+    args = arg_parser.parse_args()
+
+    start_sender()  # Briefs are queued in the outbox; deliver them from this process too
+    start_token_refresher()
+    start_metrics_exporter()
+    try:
+        if args.workers:
+            print(f"Starting {args.workers} brief workers")
+            workers = [LeaseWorker(i, batch_size=args.batch_size) for i in range(args.workers)]
+            for worker in workers:
+                worker.start()
+            for worker in workers:
+                worker.join()
+        else:
+            print("Starting brief scheduler")
+            BriefScheduler().run_forever()
+    except KeyboardInterrupt:
+        print("Brief scheduler stopped")
@@ -0,0 +1,152 @@
+import os
+import sqlite3
+import threading
+import time
+import requests
+from dotenv import load_dotenv
+from graph_client import graph
+import db
+
+# Load environment variables
+load_dotenv()
+app_id = os.getenv("app_id")
+app_secret = os.getenv("app_secret")
+user_access_token = os.getenv("user_access_token")
+long_access_token = os.getenv("long_access_token")
+token_refresh_margin = int(os.getenv("token_refresh_margin", str(7 * 24 * 3600)))  # seconds before expiry
+token_retry_delay = int(os.getenv("token_retry_delay", "600"))  # seconds
+
+TOKEN_NAME = "instagram_long_lived"
+DEFAULT_LIFETIME = 60 * 24 * 3600  # Long-lived tokens last about 60 days
+
+class TokenManager:
+    """
+    Holds the Instagram long-lived access token and its expiry. The token is
+    kept in memory and in users.db so every process shares it, and a background
+    thread exchanges it for a fresh one before it expires.
+    """
+
+    def __init__(self, name=TOKEN_NAME, refresh_margin=token_refresh_margin):
+        self.name = name
+        self.refresh_margin = refresh_margin
+        self.token = None
+        self.expires_at = None
+        self.lock = threading.Lock()
+
+    def _load(self):
+        try:
+            row = db.query_one(db.USERS, "SELECT token, expires_at FROM access_tokens WHERE name = ?", (self.name,))
+        except sqlite3.Error as e:
+            print(f"Token store error: {e}")
+            return
+        if row and (self.expires_at is None or (row[1] or 0) >= self.expires_at):
+            self.token, self.expires_at = row
+
+    def _store(self):
+        try:
+            db.execute(db.USERS, """
+                INSERT INTO access_tokens (name, token, expires_at, refreshed_at)
+                VALUES (?, ?, ?, ?)
+                ON CONFLICT(name) DO UPDATE SET
+                    token = excluded.token,
+                    expires_at = excluded.expires_at,
+                    refreshed_at = excluded.refreshed_at
+            """, (self.name, self.token, self.expires_at, time.time()))
+        except sqlite3.Error as e:
+            print(f"Token store error: {e}")
+
+    def current(self):
+        """
+        Return the current long-lived token without a network call, falling back
+        to long_access_token from .env. Only the very first call in a fresh
+        deployment, with nothing stored yet, exchanges a token inline.
+        """
+        with self.lock:
+            if self.token is None:
+                self._load()
+            if self.token is None:
+                self.token = long_access_token
+            token = self.token
+        if token is None and user_access_token:
+            try:
+                self.refresh()
+                return self.token
+            except (requests.exceptions.RequestException, KeyError, ValueError) as e:
+                print(f"Error exchanging Instagram access token: {str(e)}")
+        return token
+
+    def needs_refresh(self):
+        with self.lock:
+            self._load()  # Another process may have refreshed already
+            return self.expires_at is None or self.expires_at - time.time() <= self.refresh_margin
+
+    def refresh(self):
+        """
+        Exchange the current token for a fresh long-lived token and return its expiry.
+        The exchange runs outside the lock so current() keeps serving the old token.
+        """
+        with self.lock:
+            if self.token is None:
+                self._load()
+            # A long-lived token can be exchanged for a new one the same way a short-lived one is
+            source_token = self.token or long_access_token or user_access_token
+        if not app_id or not app_secret or not source_token:
+            raise ValueError("app_id, app_secret and an access token must be set in .env file")
+        response = graph.get("oauth/access_token", params={
+            "grant_type": "fb_exchange_token",
+            "client_id": app_id,
+            "client_secret": app_secret,
+            "fb_exchange_token": source_token
+        })
+        with self.lock:
+            self.token = response["access_token"]
+            self.expires_at = time.time() + int(response.get("expires_in") or DEFAULT_LIFETIME)
+            self._store()
+            return self.expires_at
+
+    def seconds_until_refresh(self):
+        with self.lock:
+            if self.expires_at is None:
+                return 0
+            return max(0, self.expires_at - self.refresh_margin - time.time())
+
+token_manager = TokenManager()
+
+class TokenRefresher(threading.Thread):
+    """
+    Background worker that refreshes the long-lived token ahead of its expiry.
+    """
+
+    def __init__(self, manager=token_manager, retry_delay=token_retry_delay):
+        super().__init__(name="token-refresher", daemon=True)
+        self.manager = manager
+        self.retry_delay = retry_delay
+
+    def run(self):
+        if not app_id or not app_secret:
+            print("Instagram token refresh disabled: app_id or app_secret not set in .env file")
+            return
+        while True:
+            delay = self.retry_delay
+            try:
+                if self.manager.needs_refresh():
+                    self.manager.refresh()
+                    print("Instagram access token refreshed")
+                delay = max(self.retry_delay, self.manager.seconds_until_refresh())
+            except (requests.exceptions.RequestException, KeyError, ValueError) as e:
+                print(f"Error refreshing Instagram access token: {str(e)}")
+            time.sleep(delay)
+
+_refresher = None
+_refresher_lock = threading.Lock()
+
+def start_token_refresher():
+    """
+    Start the background token refresher for this process if it is not already running.
+    """
+    global _refresher
+    with _refresher_lock:
+        if _refresher is None or not _refresher.is_alive():
+            _refresher = TokenRefresher()
+            _refresher.start()
+    return _refresher
@@ -0,0 +1,53 @@
+import os
+import sqlite3
+import time
+from dotenv import load_dotenv
+import db
+import metrics
+
+# Load environment variables
+load_dotenv()
+verification_ttl = int(os.getenv("verification_ttl", str(7 * 24 * 3600)))  # seconds, for handles that exist
+verification_negative_ttl = int(os.getenv("verification_negative_ttl", "3600"))  # seconds, for handles that do not
+
+def _normalize(handle):
+    return handle.strip().lstrip("@").lower()
+
+def get_verification(platform, handle):
+    """
+    Return True or False if the handle was checked within its TTL, or None if
+    it has to be checked again. Results are shared by every user.
+    """
+    now = time.time()
+    try:
+        row = db.query_one(
+            db.COMPETITORS,
+            "SELECT valid, checked_at FROM verifications WHERE platform = ? AND handle = ?",
+            (platform, _normalize(handle))
+        )
+    except sqlite3.Error as e:
+        print(f"Verification cache error for {handle}: {e}")
+        return None
+    valid, checked_at = (bool(row[0]), row[1]) if row else (None, 0)
+    ttl = verification_ttl if valid else verification_negative_ttl
+    if valid is None or now - checked_at > ttl:
+        metrics.increment("cache_misses", cache="verification")
+        return None
+    metrics.increment("cache_hits", cache="verification")
+    return valid
+
+def store_verification(platform, handle, valid):
+    """
+    Record a definite answer for a handle. Transient failures should not be stored.
+    """
+    try:
+        db.execute(db.COMPETITORS, """
+            INSERT INTO verifications (platform, handle, valid, checked_at)
+            VALUES (?, ?, ?, ?)
+            ON CONFLICT(platform, handle) DO UPDATE SET
+                valid = excluded.valid,
+                checked_at = excluded.checked_at
+        """, (platform, _normalize(handle), bool(valid), time.time()))
+    except sqlite3.Error as e:
+        print(f"Verification cache error for {handle}: {e}")
+    return valid
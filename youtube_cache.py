@@ -0,0 +1,57 @@
+import os
+import sqlite3
+import time
+from dotenv import load_dotenv
+import db
+import metrics
+
+# Load environment variables
+load_dotenv()
+channel_cache_ttl = int(os.getenv("youtube_channel_cache_ttl", str(7 * 24 * 3600)))  # seconds
+
+def _normalize(handle):
+    return handle.strip().lstrip("@").lower()
+
+def get_uploads_playlist(handle):
+    """
+    Return the cached uploads playlist ID for a handle, or None if it is
+    missing or older than the cache TTL.
+    """
+    try:
+        row = db.query_one(
+            db.COMPETITORS,
+            "SELECT uploads_playlist_id FROM youtube_channels WHERE handle = ? AND resolved_at >= ?",
+            (_normalize(handle), time.time() - channel_cache_ttl)
+        )
+        metrics.increment("cache_hits" if row else "cache_misses", cache="youtube_channel")
+        return row[0] if row else None
+    except sqlite3.Error as e:
+        print(f"YouTube cache error for {handle}: {e}")
+        return None
+
+def store_channel(handle, channel_item):
+    """
+    Cache the uploads playlist from a channels().list item that was requested
+    with part=contentDetails. Returns the playlist ID, or None if the item has none.
+    """
+    uploads_playlist_id = channel_item.get("contentDetails", {}).get("relatedPlaylists", {}).get("uploads")
+    if not uploads_playlist_id:
+        return None
+    try:
+        db.execute(db.COMPETITORS, """
+            INSERT INTO youtube_channels (handle, channel_id, uploads_playlist_id, resolved_at)
+            VALUES (?, ?, ?, ?)
+            ON CONFLICT(handle) DO UPDATE SET
+                channel_id = excluded.channel_id,
+                uploads_playlist_id = excluded.uploads_playlist_id,
+                resolved_at = excluded.resolved_at
+        """, (_normalize(handle), channel_item["id"], uploads_playlist_id, time.time()))
+    except sqlite3.Error as e:
+        print(f"YouTube cache error for {handle}: {e}")
+    return uploads_playlist_id
+
+def evict_channel(handle):
+    try:
+        db.execute(db.COMPETITORS, "DELETE FROM youtube_channels WHERE handle = ?", (_normalize(handle),))
+    except sqlite3.Error as e:
+        print(f"YouTube cache error for {handle}: {e}")
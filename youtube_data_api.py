@@ -1,110 +1,257 @@
 import os
 from dotenv import load_dotenv
-from googleapiclient.discovery import build
+import threading
 from googleapiclient.errors import HttpError
 from datetime import datetime, timedelta
 from dateutil import parser, tz
 from pydantic import BaseModel
-import google.generativeai as genai
+from typing import Optional
+from gemini_service import GeminiRequest, gemini_service
 import json
+from youtube_cache import get_uploads_playlist, store_channel, evict_channel
+import metrics
+from youtube_quota import QuotaExceeded, quota_context, charge, mark_exhausted, is_quota_error
 
 # Load environment variables
 load_dotenv()
 
-# Configure Gemini API
-try:
-    genai.configure(api_key=os.getenv("gemini_api_key"))
-except Exception as e:
-    print(f"Error configuring Gemini API: {str(e)}")
-    exit(1)
-
 # Define Pydantic model for response
 class Response(BaseModel):
     youtube_trend: str
     youtube_recommend: str
 
+class Video(BaseModel):
+    video_id: str
+    handle: str
+    title: str
+    description: str = "No description available"
+    published_at: Optional[str] = None
+    duration: Optional[str] = None
+    view_count: Optional[int] = None
+    like_count: Optional[int] = None
+    comment_count: Optional[int] = None
+
+VIDEOS_PER_BATCH = 50  # videos().list accepts at most 50 IDs per call
+
 # YouTube API setup
 youtube_api_key = os.getenv("youtube_data_api")
-if not youtube_api_key:
-    print("Error: YouTube API key not found in .env file")
-    exit(1)
+youtube_api_endpoint = os.getenv("youtube_api_endpoint")  # Overrides https://youtube.googleapis.com, e.g. for benchmarks
+_youtube = None
+_youtube_lock = threading.Lock()
+
+def get_youtube():
+    """
+    Return the process-wide YouTube client, built on first use from the discovery
+    document bundled with googleapiclient instead of one fetched over the network.
+    Raises ValueError if the API key is not set.
+    """
+    global _youtube
+    if _youtube is None:
+        with _youtube_lock:
+            if _youtube is None:
+                if not youtube_api_key:
+                    raise ValueError("YouTube API key not found in .env file")
+                from googleapiclient.discovery import build  # Deferred, the import alone costs ~200ms
+                _youtube = build("youtube", "v3", developerKey=youtube_api_key,
+                                 static_discovery=True, cache_discovery=False,
+                                 requestBuilder=_build_request,
+                                 client_options={"api_endpoint": youtube_api_endpoint} if youtube_api_endpoint else None)
+    return _youtube
+
+_http_local = threading.local()
+
+def thread_http():
+    """
+    Return this thread's httplib2.Http. The client is shared by the fetcher's
+    thread pool, but httplib2.Http is not thread-safe, so every thread sends
+    over its own keep-alive connection instead of the one build() creates.
+    """
+    if not hasattr(_http_local, "http"):
+        import httplib2
+        _http_local.http = httplib2.Http(timeout=30)
+    return _http_local.http
+
+def _build_request(http, *args, **kwargs):
+    # Every request is executed as soon as it is built, so this is where quota is charged
+    charge(kwargs.get("methodId"))
+    from googleapiclient.http import HttpRequest
+    request = HttpRequest(thread_http(), *args, **kwargs)  # Never the shared http passed in
+    execute = request.execute
 
-try:
-    youtube = build("youtube", "v3", developerKey=youtube_api_key)
-except Exception as e:
-    print(f"Error initializing YouTube API: {str(e)}")
-    exit(1)
+    def timed_execute(*execute_args, **execute_kwargs):
+        metrics.increment("api_calls", service="youtube")
+        with metrics.span("youtube.request", platform="youtube", method=kwargs.get("methodId")):
+            return execute(*execute_args, **execute_kwargs)
+    request.execute = timed_execute
+    return request
 
-def get_video_uploaded_youtube(handle):
+def _is_before(published_at, since):
+    try:
+        return parser.isoparse(published_at) < parser.isoparse(since)
+    except (TypeError, ValueError):
+        return False
+
+def get_video_uploaded_youtube(handle, since=None, last_seen_id=None, max_pages=5):
     """
-    Fetch the 10 most recent YouTube videos for a given channel handle.
-    Returns a dictionary with video titles as keys and descriptions as values.
+    Fetch recent YouTube videos for a given channel handle.
+    Without since, returns the 10 most recent videos. With since (a UTC ISO
+    timestamp), pages through the uploads playlist until it reaches
+    last_seen_id or a video published before since, and returns only the
+    videos in the window. Returns a list of Video records in upload order.
+    Statistics are left empty here; use enrich_videos to fill them for a
+    whole run at once.
     """
+    with quota_context(handle=handle):
+        return _get_videos(handle, since, last_seen_id, max_pages)
+
+def _get_videos(handle, since, last_seen_id, max_pages):
     try:
-        # Get channel details
-        request = youtube.channels().list(
-            part="contentDetails",
-            forHandle=handle
-        )
-        response = request.execute()
-
-        if not response.get("items"):
-            print(f"No channel found for handle: {handle}")
-            return {}
-
-        channel_id = response["items"][0]["id"]
-
-        # Get uploads playlist ID
-        request = youtube.channels().list(
-            part="contentDetails",
-            id=channel_id
-        )
-        response = request.execute()
-        
-        # Safely access uploads playlist
-        uploads_playlist_id = response["items"][0]["contentDetails"]["relatedPlaylists"].get("uploads")
-        if not uploads_playlist_id:
-            print(f"No uploads playlist found for channel: {handle}")
-            return {}
-
-        # Get recent videos
-        request = youtube.playlistItems().list(
-            part="snippet",
-            playlistId=uploads_playlist_id,
-            maxResults=10  # Limit to 10 videos
-        )
-        response = request.execute()
-
-        video_dict = {}
-        for item in response.get("items", [])[:10]:  # Ensure we take only 10 videos
-            title = item["snippet"]["title"]
-            video_description = item["snippet"].get("description", "No description available")
-            video_dict[title] = video_description
-
-        return video_dict
+        youtube = get_youtube()
+        # Resolve the uploads playlist, from cache when the handle is warm
+        uploads_playlist_id = get_uploads_playlist(handle)
+        cached = uploads_playlist_id is not None
+        if not cached:
+            request = youtube.channels().list(
+                part="contentDetails",
+                forHandle=handle
+            )
+            response = request.execute()
+
+            if not response.get("items"):
+                print(f"No channel found for handle: {handle}")
+                return []
+
+            uploads_playlist_id = store_channel(handle, response["items"][0])
+            if not uploads_playlist_id:
+                print(f"No uploads playlist found for channel: {handle}")
+                return []
+
+        videos = []
+        page_token = None
+        for _ in range(max_pages if since else 1):
+            # Get recent videos
+            request = youtube.playlistItems().list(
+                part="snippet,contentDetails",
+                playlistId=uploads_playlist_id,
+                maxResults=10,  # Limit to 10 videos per page
+                pageToken=page_token
+            )
+            try:
+                response = request.execute()
+            except HttpError as e:
+                if cached and e.resp.status == 404:
+                    evict_channel(handle)  # Stale playlist, re-resolve on the next run
+                raise
+
+            reached_seen = False
+            for item in response.get("items", [])[:10]:  # Ensure we take only 10 videos
+                snippet = item["snippet"]
+                video = Video(
+                    video_id=item.get("contentDetails", {}).get("videoId") or snippet["resourceId"]["videoId"],
+                    handle=handle,
+                    title=snippet["title"],
+                    description=snippet.get("description") or "No description available",
+                    published_at=item.get("contentDetails", {}).get("videoPublishedAt") or snippet.get("publishedAt")
+                )
+                if since and _is_before(video.published_at, since):
+                    reached_seen = True
+                    break
+                videos.append(video)  # Seen videos in the window are kept so their metadata stays fresh
+                if video.video_id == last_seen_id:
+                    reached_seen = True
+                    break
+
+            page_token = response.get("nextPageToken")
+            if reached_seen or not page_token:
+                break
 
+        return videos
+
+    except QuotaExceeded:
+        raise  # Callers defer the handle instead of treating it as empty
     except HttpError as e:
+        if is_quota_error(e):
+            mark_exhausted()
+            raise QuotaExceeded(f"YouTube quota exceeded: {str(e)}")
         print(f"YouTube API error for handle {handle}: {str(e)}")
-        return {}
+        return []
     except Exception as e:
         print(f"Error fetching YouTube videos for handle {handle}: {str(e)}")
-        return {}
-    
-def gemini_model_youtube(video_details):
+        return []
+
+def enrich_videos(videos):
+    """
+    Fill view, like and comment counts and duration for a list of Video records
+    using videos().list in batches of up to 50 IDs, so a run costs
+    ceil(N/50) calls regardless of how many channels the videos came from.
+    """
+    video_ids = list(dict.fromkeys(video.video_id for video in videos))  # Unique, order kept
+    if not video_ids:
+        return videos
     try:
-        # Initialize Gemini model
-        model = genai.GenerativeModel(
-            model_name="gemini-1.5-flash",
-            generation_config={
-                "response_mime_type": "application/json",
-                "temperature": 0.5
-            },
-            system_instruction=(
-                "You are an AI agent designed to analyze social media data across multiple users. Based on the provided YouTube video titles and descriptions, "
-                "analyze the trends and provide recommendations to succeed in the trend. Return a JSON response with 'youtube_trend' (string) and 'youtube_recommend' (string)."
+        youtube = get_youtube()
+    except ValueError as e:
+        print(f"Error enriching YouTube videos: {str(e)}")
+        return videos
+    details = {}
+    for start in range(0, len(video_ids), VIDEOS_PER_BATCH):
+        batch = video_ids[start:start + VIDEOS_PER_BATCH]
+        try:
+            request = youtube.videos().list(
+                part="statistics,contentDetails",
+                id=",".join(batch),
+                maxResults=VIDEOS_PER_BATCH
             )
-        )
-        return model.generate_content(video_details)
+            response = request.execute()
+            for item in response.get("items", []):
+                details[item["id"]] = item
+        except QuotaExceeded as e:
+            print(f"Skipping statistics for {len(video_ids) - start} videos: {str(e)}")
+            break
+        except HttpError as e:
+            if is_quota_error(e):
+                mark_exhausted()
+                print(f"YouTube quota exceeded, skipping statistics for {len(video_ids) - start} videos")
+                break
+            print(f"YouTube API error enriching {len(batch)} videos: {str(e)}")
+        except Exception as e:
+            print(f"Error enriching YouTube videos: {str(e)}")
+
+    for video in videos:
+        item = details.get(video.video_id)
+        if not item:
+            continue
+        statistics = item.get("statistics", {})
+        video.duration = item.get("contentDetails", {}).get("duration")
+        video.view_count = int(statistics["viewCount"]) if "viewCount" in statistics else None
+        video.like_count = int(statistics["likeCount"]) if "likeCount" in statistics else None
+        video.comment_count = int(statistics["commentCount"]) if "commentCount" in statistics else None
+    return videos
+
+GEMINI_MODEL_NAME = "gemini-1.5-flash"
+GEMINI_GENERATION_CONFIG = {
+    "response_mime_type": "application/json",
+    "temperature": 0.5
+}
+GEMINI_SYSTEM_INSTRUCTION = (
+    "You are an AI agent designed to analyze social media data across multiple users. Based on the provided YouTube video titles, descriptions and view, like and comment counts, "
+    "which are the top videos of each channel ranked by views against that channel's usual numbers, "
+    "analyze the trends and provide recommendations to succeed in the trend. Return a JSON response with 'youtube_trend' (string) and 'youtube_recommend' (string)."
+)
+
+def gemini_request_youtube(video_details):
+    """
+    Build the Gemini request that analyzes YouTube videos.
+    """
+    return GeminiRequest(GEMINI_MODEL_NAME, GEMINI_SYSTEM_INSTRUCTION, video_details, GEMINI_GENERATION_CONFIG)
+
+def gemini_model_youtube(video_details):
+    """
+    Analyze YouTube videos and return trends and recommendations.
+    Identical inputs are answered from the LLM response cache.
+    """
+    try:
+        return gemini_service.generate_sync(gemini_request_youtube(video_details))
     except Exception as e:
         print(f"Error initializing Gemini model: {str(e)}")
         return None
@@ -0,0 +1,159 @@
+import os
+import sqlite3
+import argparse
+import contextvars
+from contextlib import contextmanager
+from datetime import datetime
+from dateutil import tz
+from dotenv import load_dotenv
+import db
+import metrics
+
+# Load environment variables
+load_dotenv()
+youtube_daily_quota = int(os.getenv("youtube_daily_quota", "10000"))  # units per day
+youtube_quota_reserve = int(os.getenv("youtube_quota_reserve", "2000"))  # units kept for interactive use
+youtube_quota_burst = float(os.getenv("youtube_quota_burst", "0.25"))  # share of the low-priority budget usable ahead of pace
+youtube_quota_defer_seconds = int(os.getenv("youtube_quota_defer_seconds", "1800"))
+
+# Units per call, from the YouTube Data API quota table. Every other method we call costs 1.
+METHOD_COSTS = {
+    "youtube.search.list": 100,
+}
+QUOTA_TIMEZONE = tz.gettz("America/Los_Angeles")  # Quota resets at midnight Pacific time
+HIGH = "high"
+LOW = "low"
+
+_user = contextvars.ContextVar("quota_user", default=None)
+_handle = contextvars.ContextVar("quota_handle", default=None)
+_priority = contextvars.ContextVar("quota_priority", default=HIGH)
+
+class QuotaExceeded(Exception):
+    """
+    Raised before a YouTube call that would overrun the daily budget for its priority.
+    """
+
+@contextmanager
+def quota_context(user=None, handle=None, priority=None):
+    """
+    Attribute YouTube calls made inside the block to a user and handle, and set
+    their priority. Unset arguments keep the enclosing values. Thread pools
+    must run work in a copy of the context (contextvars.copy_context().run).
+    """
+    tokens = [(var, var.set(value)) for var, value in ((_user, user), (_handle, handle), (_priority, priority)) if value is not None]
+    try:
+        with metrics.tagged(user=user, handle=handle):  # The same attribution for timings and logs
+            yield
+    finally:
+        for var, token in reversed(tokens):
+            var.reset(token)
+
+def quota_day(now=None):
+    return (now or datetime.now(QUOTA_TIMEZONE)).astimezone(QUOTA_TIMEZONE).date().isoformat()
+
+def _day_fraction(now):
+    now = now.astimezone(QUOTA_TIMEZONE)
+    midnight = now.replace(hour=0, minute=0, second=0, microsecond=0)
+    return (now - midnight).total_seconds() / 86400
+
+def allowance(priority=HIGH, now=None):
+    """
+    Return how many units may have been spent so far today by calls of this priority.
+    High-priority calls may use the whole budget. Low-priority calls stay out
+    of the reserve and are paced across the day, plus a burst allowance.
+    """
+    if priority == HIGH:
+        return youtube_daily_quota
+    now = now or datetime.now(QUOTA_TIMEZONE)
+    low_budget = max(0, youtube_daily_quota - youtube_quota_reserve)
+    return low_budget * min(1.0, _day_fraction(now) + youtube_quota_burst)
+
+def used(day=None):
+    row = db.query_one(db.COMPETITORS, "SELECT COALESCE(SUM(units), 0) FROM youtube_quota WHERE day = ?",
+                       (day or quota_day(),))
+    return row[0]
+
+def can_spend(units, priority=LOW, now=None):
+    """
+    Return True if units more can be spent now at this priority.
+    """
+    try:
+        return used(quota_day(now)) + units <= allowance(priority, now)
+    except sqlite3.Error as e:
+        print(f"YouTube quota error: {e}")
+        return True
+
+def charge(method_id, units=None):
+    """
+    Record one call to method_id against today's quota, attributed to the current
+    user and handle. Raises QuotaExceeded instead if the call does not fit the budget.
+    """
+    units = METHOD_COSTS.get(method_id, 1) if units is None else units
+    priority = _priority.get()
+    day = quota_day()
+    try:
+        with db.transaction(db.COMPETITORS, immediate=True) as conn:
+            spent = conn.execute("SELECT COALESCE(SUM(units), 0) FROM youtube_quota WHERE day = ?", (day,)).fetchone()[0]
+            if spent + units > allowance(priority):
+                metrics.increment("quota_rejections", priority=priority)
+                raise QuotaExceeded(f"YouTube quota budget reached for {priority}-priority calls ({spent}/{youtube_daily_quota} units used today)")
+            conn.execute("""
+                INSERT INTO youtube_quota (day, user, handle, method, units, calls)
+                VALUES (?, ?, ?, ?, ?, 1)
+                ON CONFLICT(day, user, handle, method) DO UPDATE SET
+                    units = units + excluded.units,
+                    calls = calls + 1
+            """, (day, _user.get() or "", _handle.get() or "", method_id, units))
+    except sqlite3.Error as e:
+        print(f"YouTube quota error: {e}")  # Accounting must not block the call itself
+
+def estimate_fetch(handle_count):
+    """
+    Rough units for one fetch of handle_count channels: a channel lookup and a
+    playlist page each, plus one videos().list per 50 videos of 10 per channel.
+    """
+    return 2 * handle_count + -(-handle_count * 10 // 50)
+
+def mark_exhausted():
+    """
+    Record that YouTube rejected a call for quota, so the rest of the day is skipped.
+    """
+    day = quota_day()
+    try:
+        remaining = youtube_daily_quota - used(day)
+        if remaining > 0:
+            db.execute(db.COMPETITORS, """
+                INSERT INTO youtube_quota (day, user, handle, method, units, calls)
+                VALUES (?, '', '', 'quotaExceeded', ?, 0)
+                ON CONFLICT(day, user, handle, method) DO UPDATE SET units = units + excluded.units
+            """, (day, remaining))
+    except sqlite3.Error as e:
+        print(f"YouTube quota error: {e}")
+
+def is_quota_error(error):
+    """
+    Return True if an HttpError is YouTube reporting that the daily quota is used up.
+    """
+    return getattr(getattr(error, "resp", None), "status", None) == 403 and b"quotaExceeded" in (error.content or b"")
+
+def usage(day=None, group_by="user"):
+    """
+    Return [(user or handle, units, calls), ...] for a day, largest first.
+    """
+    column = {"user": "user", "handle": "handle"}[group_by]
+    return db.query(db.COMPETITORS, f"""
+        SELECT {column}, SUM(units), SUM(calls) FROM youtube_quota
+        WHERE day = ? GROUP BY {column} ORDER BY SUM(units) DESC
+    """, (day or quota_day(),))
+
+if __name__ == "__main__":
+    arg_parser = argparse.ArgumentParser(description="Report YouTube Data API quota usage.")
+    arg_parser.add_argument("--day", help="quota day (YYYY-MM-DD, Pacific time), defaults to today")
+    args = arg_parser.parse_args()
+
+    day = args.day or quota_day()
+    print(f"YouTube quota for {day}: {used(day)}/{youtube_daily_quota} units")
+    for group_by in ("user", "handle"):
+        print(f"\nBy {group_by}:")
+        for name, units, calls in usage(day, group_by):
+            print(f"  {name or '(unattributed)':<30}{units:>8} units{calls:>6} calls")